@@ -0,0 +1,142 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# adaptive speed/averaging. each point starts at the cheapest setting that
+# was enough for its neighbour, and only steps up the ladder of meter
+# settings where the scatter of the readings misses the noise budget.
+# see hiokiIM3536._adaptive_sweep
+#
+#   budget = NoiseBudget(target=5e-4)
+#   buf = lcr._adaptive_sweep(freqs, budget, ['EQUIVALENT_SERIES_CAPACITANCE'])
+#   buf.column('SPEED'), buf.column('AVERAGING'), buf.column('UNCERTAINTY')
+import math
+
+# AquireSpeed in order of measurement time, the SPEED column holds the index
+SpeedLevels = ['FAST', 'MED', 'SLOW', 'SLOW2']
+
+# (speed, averaging) from quickest to quietest
+DefaultLadder = [
+        ('FAST', 'OFF'),
+        ('MED', 'OFF'),
+        ('SLOW', 'OFF'),
+        ('SLOW2', 'OFF'),
+        ('SLOW2', 4),
+        ('SLOW2', 16),
+        ('SLOW2', 64),
+        ]
+
+
+class RunningStats(object):
+    "Welford running mean and variance of one value"
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return float('inf')
+        return self._m2 / (self.count - 1)
+
+
+    @property
+    def relative_uncertainty(self):
+        # standard error of the mean relative to the mean
+        if self.count < 2 or self.mean == 0:
+            return float('inf')
+        return math.sqrt(self.variance / self.count) / abs(self.mean)
+
+
+class NoiseBudget(object):
+    "Target relative uncertainty and how to spend readings reaching it"
+
+    def __init__(self, target = 1e-3, ladder = None, min_readings = 5,
+                 readings_per_step = 8, max_readings = 50, item = None,
+                 sticky = True):
+        # target - relative standard error of the mean of item per point
+        # ladder - (speed, averaging) steps, cheapest first
+        # min_readings - readings before the scatter is judged
+        # readings_per_step - readings at a step before moving up
+        # max_readings - per point, the top step keeps reading until then
+        # item - ParameterBitMapping key judged, None for IMPEDANCE or the
+        #        first item
+        # sticky - start each point one step below where the last ended
+        #          instead of at the bottom of the ladder
+        self.target = target
+        self.ladder = list(ladder if ladder is not None else DefaultLadder)
+        self.min_readings = max(int(min_readings), 2)
+        self.readings_per_step = max(int(readings_per_step),
+                                     self.min_readings)
+        self.max_readings = int(max_readings)
+        self.item = item
+        self.sticky = sticky
+        self.stats = RunningStats()
+        self.step = 0
+
+
+    def pick_item(self, fields):
+        if self.item is not None:
+            return self.item
+        return 'IMPEDANCE' if 'IMPEDANCE' in fields else fields[0]
+
+
+    def start_point(self):
+        # ladder step to begin the next point at
+        self.stats.reset()
+        self.step = max(self.step - 1, 0) if self.sticky else 0
+        return self.step
+
+
+    def add(self, value, total):
+        # one reading at the current step, total readings so far at this
+        # point. returns 'done', 'more' or 'escalate' (stats are reset and
+        # step moves up).
+        stats = self.stats
+        stats.add(value)
+        if stats.count >= self.min_readings \
+                and stats.relative_uncertainty <= self.target:
+            return 'done'
+        if total >= self.max_readings:
+            return 'done'
+        if stats.count >= self.readings_per_step \
+                and self.step < len(self.ladder) - 1:
+            self.step += 1
+            stats.reset()
+            return 'escalate'
+        return 'more'
@@ -0,0 +1,264 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# asyncio front end for running many IM3536s from one event loop over their
+# LAN ports (raw SCPI socket, '\r' terminated). mirrors the main operations
+# of hiokiIM3536; every transaction takes the instrument's lock so commands
+# to one meter stay in order while different meters overlap.
+#
+#   async def main():
+#       meters = [AsyncIM3536(host) for host in hosts]
+#       await asyncio.gather(*(m.open() for m in meters))
+#       await asyncio.gather(*(m.set_measurements(['IMPEDANCE']) for m in meters))
+#       readings = await asyncio.gather(*(m.get_measurements() for m in meters))
+import asyncio
+
+from .hiokiIM3536 import (ParameterBitMapping, ESR0_BitMapping,
+                          MeasurementResult, SettingCommandMapping,
+                          MinimumMeasurementFrequency,
+                          MaximumMeasurementFrequency)
+from .profile import MeasurementProfile, ProfileFieldMapping
+
+def _item_bytes(items):
+    item_bytes = [0, 0, 0]
+    for item in items:
+        if item not in ParameterBitMapping:
+            raise ValueError(item)
+        (bit, reg) = ParameterBitMapping[item]
+        item_bytes[reg] |= 0x01 << bit
+    return item_bytes
+
+
+def _check_frequency(value):
+    value = float(value)
+    if not MinimumMeasurementFrequency <= value <= MaximumMeasurementFrequency:
+        raise ValueError('frequency %g out of range' % value)
+    return value
+
+
+def _item_order(item_bytes):
+    order = [item for item in ParameterBitMapping
+             if item_bytes[ParameterBitMapping[item][1]]
+             & (0x01 << ParameterBitMapping[item][0])]
+    if not order:
+        raise IOError('no measurement order possible '
+                      'as no measurements configured')
+    return sorted(order, key=lambda k: ParameterBitMapping[k][0]
+                  + ParameterBitMapping[k][1] * 8)
+
+
+class AsyncIM3536(object):
+    "asyncio HIOKI IM3536 LCR Meter front end"
+
+    def __init__(self, host, port = 3500, timeout = 10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.term_char = b'\r'
+        self.measurement_wait_mode = 'NONE' # NONE, OPC or POLL
+        self.profile = MeasurementProfile()
+        self._order = None
+        self._lock = None
+        self._reader = None
+        self._writer = None
+
+
+    async def open(self):
+        self._lock = asyncio.Lock()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        return self
+
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+        self._writer = None
+        self._reader = None
+
+
+    async def __aenter__(self):
+        return await self.open()
+
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+    # I/O, callers hold self._lock
+
+    async def _send(self, data):
+        self._writer.write(data.encode('utf-8') + self.term_char)
+        await self._writer.drain()
+
+
+    async def _query(self, data):
+        await self._send(data)
+        resp = await asyncio.wait_for(self._reader.readuntil(self.term_char),
+                                      self.timeout)
+        return resp.decode('utf-8').rstrip('\r\n')
+
+
+    async def write(self, data):
+        async with self._lock:
+            await self._send(data)
+
+
+    async def ask(self, data):
+        async with self._lock:
+            return await self._query(data)
+
+
+    # configuration
+
+    async def configure(self, profile = None, **settings):
+        # apply a MeasurementProfile (or the same fields as keywords),
+        # sending only what differs from the last applied state as one
+        # concatenated message followed by *OPC?
+        if profile is None:
+            profile = MeasurementProfile(**settings)
+        elif settings:
+            profile = profile.replace(**settings)
+        if profile.measurement_frequency is not None:
+            _check_frequency(profile.measurement_frequency)
+
+        commands = []
+        known = self.profile.to_dict()
+        for field in ProfileFieldMapping:
+            value = getattr(profile, field)
+            if value is None or known.get(field) == value:
+                continue
+            if field == 'range' and profile.autorange == 'ON':
+                # setting a range would turn autorange back off
+                continue
+            commands.append(SettingCommandMapping[field][1] % value)
+            known[field] = value
+            if field == 'range':
+                # selecting a range turns autorange off on the instrument
+                known['autorange'] = 'OFF'
+        if profile.measurement_items is not None \
+                and known.get('measurement_items') != list(profile.measurement_items):
+            commands.append(':MEAS:ITEM %d,%d,%d'
+                            % tuple(_item_bytes(profile.measurement_items)))
+            known['measurement_items'] = list(profile.measurement_items)
+        if not commands:
+            return
+
+        message = ';'.join(c if c[0] in ':*' else ':' + c for c in commands)
+        async with self._lock:
+            self._order = None
+            await self._send(message)
+            await self._query('*OPC?')
+            self.profile = MeasurementProfile(**known)
+            if profile.measurement_items is not None:
+                self._order = _item_order(_item_bytes(profile.measurement_items))
+
+
+    async def set_measurement_frequency(self, value):
+        await self.configure(measurement_frequency=value)
+
+
+    async def set_measurements(self, items):
+        await self.configure(measurement_items=items)
+
+
+    async def trigger(self):
+        await self.write('*TRG')
+
+
+    # measurements
+
+    async def _measurement_order(self):
+        if self._order is None:
+            resp = await self._query(':MEAS:ITEM?')
+            self._order = _item_order([int(i) for i in
+                                       resp.replace(',', ' ').split()])
+        return self._order
+
+
+    async def _wait_end_of_measurement(self):
+        if self.measurement_wait_mode == 'OPC':
+            await self._query('*OPC?')
+        elif self.measurement_wait_mode == 'POLL':
+            eom = 0x01 << ESR0_BitMapping['EOM']
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            status = 0
+            while not status & eom:
+                if loop.time() > deadline:
+                    raise asyncio.TimeoutError('no end of measurement')
+                status |= int((await self._query(':ESR0?')).split()[0])
+            return status
+        return None
+
+
+    async def _fetch_measurements(self):
+        status = await self._wait_end_of_measurement()
+        order = await self._measurement_order()
+        resp = (await self._query(':MEAS?')).replace(',', ' ').split()
+        if len(resp) != len(order):
+            self._order = None
+            raise IOError('data config doesnt match data recieved')
+        reading = MeasurementResult(zip(order, (float(v) for v in resp)))
+        if status is not None:
+            reading.status = dict((name, bool(status & (0x01 << bit)))
+                                  for (name, bit) in ESR0_BitMapping.items())
+        return reading
+
+
+    async def get_measurements(self):
+        async with self._lock:
+            return await self._fetch_measurements()
+
+
+    async def frequency_sweep(self, frequencies, parameters = None):
+        # async generator of (frequency, measurement dict), one FREQ write
+        # and one :MEAS? per point. the lock is held per point so other
+        # callers can interleave between points without reordering them.
+        if parameters is not None:
+            await self.set_measurements(parameters)
+        for freq in frequencies:
+            freq = _check_frequency(round(freq, 3))
+            async with self._lock:
+                await self._send(SettingCommandMapping[
+                        'measurement_frequency'][1] % freq)
+                if self.measurement_wait_mode == 'POLL':
+                    # drop the EOM latched on the previous frequency
+                    await self._query(':ESR0?')
+                reading = await self._fetch_measurements()
+            self.profile = self.profile.replace(measurement_frequency=freq)
+            yield (freq, reading)
+
+
+    async def get_actual_measurement_powers(self):
+        order = ['VAC','IAC','VDC','IDC']
+        resp = (await self.ask(':MONI?')).replace(',', ' ').split()
+        return dict(zip(order, (float(v) for v in resp)))
+
+
+async def gather_measurements(meters):
+    # one reading from each meter concurrently, in the order given
+    return await asyncio.gather(*(m.get_measurements() for m in meters))
@@ -0,0 +1,312 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# benchmarks for the driver hot paths, run against simulator.py.
+# results are JSON so runs from different driver versions can be compared.
+#
+#   python -m hioki.benchmark --out new.json
+#   python -m hioki.benchmark --out new.json --compare old.json
+import argparse
+import json
+import platform
+import sys
+import time
+import warnings
+
+from .hiokiIM3536 import hiokiIM3536, ParameterBitMapping, AquireSpeed
+from .interface import SocketInstrument
+from .simulator import SimulatedIM3536, SeriesRLC, serve_tcp
+
+# parameter sets of increasing size, in ParameterBitMapping order
+ParameterSetSizes = [1, 2, 4, 8, len(ParameterBitMapping)]
+
+# results where bigger is better, everything else is a cost
+HigherIsBetter = set(['readings_per_sec'])
+# too noisy to gate on, reported only
+NotCompared = set(['overhead'])
+
+
+def percentiles(samples, points = (50, 90, 99)):
+    samples = sorted(samples)
+    result = {}
+    for p in points:
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        result['p%d' % p] = samples[index]
+    return result
+
+
+def parameter_set(size):
+    keys = sorted(ParameterBitMapping,
+                  key=lambda k: ParameterBitMapping[k][0]
+                  + ParameterBitMapping[k][1] * 8)
+    return keys[:size]
+
+
+class Benchmark(object):
+    "Runs the driver against an in-process simulator"
+
+    def __init__(self, duration = 0.5, latency = 0.0, realtime = False):
+        # duration - seconds spent on each throughput case
+        # latency - simulated per-message latency
+        # realtime - simulator measurement timing follows the speed setting
+        self.duration = duration
+        self.sim = SimulatedIM3536(SeriesRLC(10.0, None, 1e-6),
+                                   latency=latency, realtime=realtime)
+        self.server = serve_tcp(self.sim, 'localhost', 0)
+        host, port = self.server.server_address
+        self.lcr = hiokiIM3536(SocketInstrument(host, port))
+
+
+    def close(self):
+        self.lcr.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def _throughput(self, read, readings_per_call = 1):
+        sim = self.sim
+        bytes_start = sim.bytes_in + sim.bytes_out
+        messages_start = sim.messages
+        calls = 0
+        start = time.perf_counter()
+        end = start + self.duration
+        while time.perf_counter() < end:
+            read()
+            calls += 1
+        elapsed = time.perf_counter() - start
+        readings = calls * readings_per_call
+        return {
+            'readings_per_sec': readings / elapsed,
+            'bytes_per_reading':
+                (sim.bytes_in + sim.bytes_out - bytes_start) / float(readings),
+            'messages_per_reading':
+                (sim.messages - messages_start) / float(readings),
+            }
+
+
+    def readings(self):
+        # _get_measurements throughput across parameter set sizes, for the
+        # default fast path, paranoid mode and the columnar path
+        lcr = self.lcr
+        results = {}
+        for size in ParameterSetSizes:
+            lcr._set_measurements(parameter_set(size))
+
+            lcr.paranoid_measurements = False
+            results['dict/%d' % size] = self._throughput(lcr._get_measurements)
+
+            lcr.paranoid_measurements = True
+            results['paranoid/%d' % size] = \
+                self._throughput(lcr._get_measurements)
+            lcr.paranoid_measurements = False
+
+            buf = lcr._new_measurement_buffer(capacity = 1024)
+            def columnar():
+                if len(buf) >= 1024:
+                    buf.clear()
+                lcr._fetch_measurements_into(buf)
+            results['columnar/%d' % size] = self._throughput(columnar)
+        return results
+
+
+    def speeds(self):
+        # readings/sec at each AquireSpeed, waiting for EOM with the
+        # simulator in realtime so the measurement time counts
+        lcr = self.lcr
+        lcr._set_measurements(parameter_set(2))
+        lcr.measurement_wait_mode = 'POLL'
+        realtime, self.sim.realtime = self.sim.realtime, True
+        results = {}
+        try:
+            for speed in sorted(AquireSpeed):
+                lcr._set_aquire_speed(speed)
+                results[speed] = self._throughput(lcr._get_measurements)
+        finally:
+            self.sim.realtime = realtime
+            lcr.measurement_wait_mode = 'NONE'
+            lcr._set_aquire_speed('MED')
+        return results
+
+
+    def commands(self, count = 200):
+        # per-command latency percentiles in seconds
+        lcr = self.lcr
+        cases = {
+            'set_measurement_frequency':
+                lambda: lcr._set_measurement_frequency(1000),
+            'set_meas_sig_cv': lambda: lcr._set_meas_sig_cv(0.5),
+            'set_dc_bias': lambda: lcr._set_dc_bias(0.0),
+            'opc': lcr._wait_cmd_processing_finished,
+            'meas_item_query': lcr._get_measurement_items,
+            'moni_query': lcr._get_actual_measurement_powers,
+            }
+        results = {}
+        for (name, call) in sorted(cases.items()):
+            samples = []
+            for i in range(count):
+                start = time.perf_counter()
+                call()
+                # writes return before the meter has them, follow with a
+                # query so every sample covers a complete transaction
+                if name.startswith('set_'):
+                    lcr._wait_cmd_processing_finished()
+                samples.append(time.perf_counter() - start)
+            results[name] = percentiles(samples)
+        return results
+
+
+    def profile(self):
+        # per reading wait/query/parse breakdown from the driver's own
+        # instrumentation, and what turning it on costs in throughput
+        lcr = self.lcr
+        lcr._set_measurements(parameter_set(2))
+        plain = self._throughput(lcr._get_measurements)
+        profiler = lcr._enable_profiling()
+        try:
+            profiled = self._throughput(lcr._get_measurements)
+        finally:
+            lcr._disable_profiling()
+        summary = profiler.summary()
+        return {
+            'phases': dict((phase, hist.get('mean'))
+                           for (phase, hist) in summary['readings'].items()),
+            'overhead': plain['readings_per_sec']
+                / profiled['readings_per_sec'] - 1,
+            }
+
+
+    def parsing(self, block = 1000):
+        # parse cost per reading without any I/O, dict and numpy paths
+        lcr = self.lcr
+        results = {}
+        for size in ParameterSetSizes:
+            order = parameter_set(size)
+            resp = ','.join(['1.234567E-06'] * (size * block))
+
+            start = time.process_time()
+            lcr._parse_measurement_block(resp.replace(',', ' ').split(), order)
+            dict_cost = (time.process_time() - start) / block
+
+            entry = {'dict_sec_per_reading': dict_cost}
+            try:
+                from .buffer import MeasurementBuffer, parse_values
+            except ImportError:
+                pass
+            else:
+                buf = MeasurementBuffer(order, block)
+                start = time.process_time()
+                buf.extend(parse_values(resp))
+                entry['numpy_sec_per_reading'] = \
+                    (time.process_time() - start) / block
+            results['%d' % size] = entry
+        return results
+
+
+    def run(self):
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'duration': self.duration,
+                'latency': self.sim.latency,
+                'realtime': self.sim.realtime,
+                'time': time.time(),
+                },
+            'readings': self.readings(),
+            'speeds': self.speeds(),
+            'commands': self.commands(),
+            'parsing': self.parsing(),
+            'profile': self.profile(),
+            }
+
+
+def _flatten(d, prefix = ''):
+    flat = {}
+    for (key, value) in d.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(old, new, threshold = 0.1):
+    # list of (metric, old, new) that got worse by more than threshold
+    old = _flatten(dict((k, v) for (k, v) in old.items() if k != 'meta'))
+    new = _flatten(dict((k, v) for (k, v) in new.items() if k != 'meta'))
+    regressions = []
+    for (name, new_value) in sorted(new.items()):
+        old_value = old.get(name)
+        if not old_value or name.split('.')[-1] in NotCompared:
+            continue
+        change = (new_value - old_value) / float(old_value)
+        if name.split('.')[-1] in HigherIsBetter:
+            change = -change
+        if change > threshold:
+            regressions.append((name, old_value, new_value))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='IM3536 driver benchmarks')
+    parser.add_argument('--out', help='write JSON results here')
+    parser.add_argument('--compare', help='previous JSON results')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as a regression')
+    parser.add_argument('--duration', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--realtime', action='store_true')
+    args = parser.parse_args(argv)
+
+    # the driver's SyntaxWarnings and simulate prints are noise here
+    warnings.simplefilter('ignore')
+
+    bench = Benchmark(args.duration, args.latency, args.realtime)
+    try:
+        results = bench.run()
+    finally:
+        bench.close()
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        regressions = compare(old, results, args.threshold)
+        for (name, old_value, new_value) in regressions:
+            sys.stderr.write('regression %s: %g -> %g\n'
+                             % (name, old_value, new_value))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# columnar measurement storage. numpy is only needed if you use this module,
+# the driver imports it lazily.
+import threading
+
+import numpy as np
+
+
+def parse_values(resp):
+    # comma separated :MEAS? / :MEM? response -> flat float64 array.
+    # avoids building a python float per token.
+    return np.fromstring(resp, dtype=np.float64, sep=',')
+
+
+class MeasurementBuffer(object):
+    "Preallocated, growable columnar store of readings"
+
+    def __init__(self, fields, capacity = 1024):
+        # fields - column names in :MEAS? order, optionally prefixed with
+        #          extra columns (eg 'FREQUENCY') filled in by the caller
+        self.fields = list(fields)
+        self.dtype = np.dtype([(field, np.float64) for field in self.fields])
+        self._width = len(self.fields)
+        self._length = 0
+        self._allocate(max(int(capacity), 1))
+
+
+    @classmethod
+    def from_columns(cls, fields, columns):
+        # build a buffer from a dict of equal length column arrays
+        length = len(columns[fields[0]]) if fields else 0
+        buf = cls(fields, length)
+        for field in fields:
+            buf._data[field][:length] = columns[field]
+        buf._length = length
+        return buf
+
+
+    def _allocate(self, capacity):
+        data = np.zeros(capacity, dtype=self.dtype)
+        if self._length:
+            data[:self._length] = self._data[:self._length]
+        self._data = data
+        # every field is float64, so the record array can be viewed as a
+        # plain 2d array for fast row/block writes
+        self._rows = data.view(np.float64).reshape(capacity, self._width)
+
+
+    def _reserve(self, count):
+        needed = self._length + count
+        capacity = len(self._data)
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            self._allocate(capacity)
+
+
+    def __len__(self):
+        return self._length
+
+
+    @property
+    def data(self):
+        "structured array view of the stored readings"
+        return self._data[:self._length]
+
+
+    def column(self, name):
+        return self._data[name][:self._length]
+
+
+    @property
+    def rows(self):
+        "2d float64 view of the stored readings, one row per reading"
+        return self._rows[:self._length]
+
+
+    def clear(self):
+        self._length = 0
+
+
+    def truncate(self, length):
+        self._length = min(self._length, int(length))
+
+
+    def new_row(self):
+        # reserve one row and return a writable float64 view of it
+        self._reserve(1)
+        row = self._rows[self._length]
+        self._length += 1
+        return row
+
+
+    def append(self, values):
+        # values - sequence of floats in field order
+        self.new_row()[:] = values
+
+
+    def extend(self, values):
+        # values - flat or 2d float array, whole rows in field order
+        values = np.asarray(values, dtype=np.float64).reshape(-1, self._width)
+        count = len(values)
+        self._reserve(count)
+        self._rows[self._length:self._length + count] = values
+        self._length += count
+
+
+class RingBuffer(object):
+    "Fixed size, preallocated ring of readings for one producer/consumer"
+
+    def __init__(self, fields, capacity = 65536):
+        # when the producer catches up with an unread row it overwrites it
+        # and counts an overrun, it never waits for the consumer
+        self.fields = list(fields)
+        self.dtype = np.dtype([(field, np.float64) for field in self.fields])
+        self.capacity = int(capacity)
+        self._data = np.zeros(self.capacity, dtype=self.dtype)
+        self._rows = self._data.view(np.float64).reshape(self.capacity,
+                                                         len(self.fields))
+        self._written = 0
+        self._read = 0
+        self.overruns = 0
+        self._cond = threading.Condition()
+
+
+    def __len__(self):
+        # unread rows
+        return self._written - self._read
+
+
+    @property
+    def written(self):
+        return self._written
+
+
+    def append(self, values):
+        # values - one row in field order
+        with self._cond:
+            if self._written - self._read >= self.capacity:
+                self._read += 1
+                self.overruns += 1
+            self._rows[self._written % self.capacity] = values
+            self._written += 1
+            self._cond.notify_all()
+
+
+    def read(self, max_count = None, timeout = None):
+        # copy out unread rows as a structured array, oldest first.
+        # blocks up to timeout seconds for data (None = forever, 0 = don't)
+        with self._cond:
+            if self._written == self._read and timeout != 0:
+                self._cond.wait(timeout)
+            count = self._written - self._read
+            if max_count is not None:
+                count = min(count, int(max_count))
+            out = self._data.take(np.arange(self._read, self._read + count),
+                                  mode='wrap')
+            self._read += count
+        return out
+
+
+    def wake(self):
+        # release a consumer blocked in read
+        with self._cond:
+            self._cond.notify_all()
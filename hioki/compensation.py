@@ -0,0 +1,284 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# software open/short/load fixture compensation.
+# open, short and (optionally) load standards are measured once per
+# fixture over a frequency grid and kept in an on-disk cache, later
+# sweeps are corrected in software as whole arrays.
+#
+#   cache = CompensationCache('~/.cache/im3536-comp')
+#   comp = cache.lookup('kelvin-clip', freqs)
+#   if comp is None:
+#       comp = Compensation('kelvin-clip', freqs)
+#       comp.open = lcr._capture_compensation(freqs)    # leads open
+#       comp.short = lcr._capture_compensation(freqs)   # leads shorted
+#       cache.save(comp)
+#   lcr._set_software_compensation(comp)
+#
+# correction, with Zm the measured impedance and Zo, Zs the open and short
+# measurements:
+#   Yo = 1 / (Zo - Zs)
+#   Zx = (Zm - Zs) / (1 - (Zm - Zs) * Yo)
+# and with a load standard of known value Zstd measuring Zl (open/short
+# corrected the same way to Zlx):
+#   Zdut = Zx * Zstd / Zlx
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .buffer import MeasurementBuffer
+from .derived import DerivableParameters, derive_parameters
+
+CompensationStandards = ['open', 'short', 'load']
+
+
+def to_complex(impedance, phase):
+    # |Z| and phase in degrees -> complex Z
+    return np.asarray(impedance) * np.exp(1j * np.radians(phase))
+
+
+def grid_key(frequencies):
+    # stable id of a frequency grid, frequencies rounded as the driver
+    # sends them
+    grid = np.round(np.asarray(frequencies, dtype=np.float64), 3)
+    return hashlib.sha1(grid.tobytes()).hexdigest()[:16]
+
+
+class Compensation(object):
+    "Open/short/load data of one fixture over one frequency grid"
+
+    def __init__(self, fixture, frequencies, open = None, short = None,
+                 load = None, load_standard = None):
+        # open, short, load - complex measured impedance per frequency
+        # load_standard - true complex impedance of the load standard,
+        #                 scalar or per frequency
+        self.fixture = fixture
+        self.frequencies = np.round(np.asarray(frequencies,
+                                               dtype=np.float64), 3)
+        self.open = open
+        self.short = short
+        self.load = load
+        self.load_standard = load_standard
+
+
+    @property
+    def key(self):
+        return '%s-%s' % (self.fixture, grid_key(self.frequencies))
+
+
+    @property
+    def standards(self):
+        return [name for name in CompensationStandards
+                if getattr(self, name) is not None]
+
+
+    def _at(self, data, frequency):
+        # data per grid point -> data at frequency. exact grid points are
+        # used as they are, anything else is interpolated on log frequency
+        if frequency is None:
+            return data
+        frequency = np.asarray(frequency, dtype=np.float64)
+        if frequency.shape == self.frequencies.shape \
+                and np.array_equal(np.round(frequency, 3), self.frequencies):
+            return data
+        if len(self.frequencies) == 1:
+            return np.broadcast_to(data, frequency.shape)
+        x = np.log(self.frequencies)
+        xi = np.log(frequency)
+        return (np.interp(xi, x, data.real) + 1j * np.interp(xi, x, data.imag))
+
+
+    def covers(self, frequencies):
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        return (len(self.frequencies) > 0
+                and frequencies.min() >= self.frequencies.min()
+                and frequencies.max() <= self.frequencies.max())
+
+
+    def correct(self, z, frequency = None):
+        # complex impedance array measured at frequency (defaults to the
+        # grid) -> corrected complex impedance
+        z = np.asarray(z, dtype=np.complex128)
+        zs = 0.0 if self.short is None else self._at(self.short, frequency)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.open is None:
+                yo = 0.0
+            else:
+                yo = 1.0 / (self._at(self.open, frequency) - zs)
+
+            zx = (z - zs) / (1.0 - (z - zs) * yo)
+            if self.load is not None and self.load_standard is not None:
+                zl = self._at(self.load, frequency)
+                zlx = (zl - zs) / (1.0 - (zl - zs) * yo)
+                zx = zx * np.asarray(self.load_standard) / zlx
+        return zx
+
+
+    def correct_buffer(self, buf, frequency = None):
+        # MeasurementBuffer with IMPEDANCE and IMPEDANCE_PHASE_ANGLE and a
+        # FREQUENCY column (or frequency given) -> new buffer with the same
+        # columns, the derivable ones recomputed from the corrected Z
+        if 'FREQUENCY' in buf.fields:
+            frequency = buf.column('FREQUENCY')
+        elif frequency is None:
+            raise ValueError('frequency required to correct readings')
+        if 'IMPEDANCE' not in buf.fields \
+                or 'IMPEDANCE_PHASE_ANGLE' not in buf.fields:
+            raise ValueError('correction needs IMPEDANCE and '
+                             'IMPEDANCE_PHASE_ANGLE readings')
+
+        frequency = np.broadcast_to(frequency, (len(buf),))
+        z = self.correct(to_complex(buf.column('IMPEDANCE'),
+                                    buf.column('IMPEDANCE_PHASE_ANGLE')),
+                         frequency)
+
+        items = [field for field in buf.fields if field in DerivableParameters]
+        columns = dict((field, buf.column(field)) for field in buf.fields)
+        columns.update(derive_parameters(np.abs(z), np.degrees(np.angle(z)),
+                                         frequency, items))
+        return MeasurementBuffer.from_columns(buf.fields, columns)
+
+
+    def to_arrays(self):
+        arrays = {'frequencies': self.frequencies}
+        for name in self.standards:
+            arrays[name] = np.asarray(getattr(self, name), dtype=np.complex128)
+        if self.load_standard is not None:
+            arrays['load_standard'] = np.asarray(self.load_standard,
+                                                 dtype=np.complex128)
+        return arrays
+
+
+class CompensationCache(object):
+    "Directory of Compensation data with a json index"
+
+    # index.json: key -> {fixture, grid, points, min_freq, max_freq,
+    #                     standards, file, saved}
+    # each Compensation is one .npz file next to it
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+
+    def _index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+
+    def index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+
+    def _write_index(self, index):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f, indent=1, sort_keys=True)
+            os.replace(tmp, self._index_path())
+        except:
+            os.unlink(tmp)
+            raise
+
+
+    def save(self, comp):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        filename = comp.key + '.npz'
+        np.savez(os.path.join(self.path, filename), **comp.to_arrays())
+
+        index = self.index()
+        index[comp.key] = {
+            'fixture': comp.fixture,
+            'grid': grid_key(comp.frequencies),
+            'points': len(comp.frequencies),
+            'min_freq': float(comp.frequencies.min()),
+            'max_freq': float(comp.frequencies.max()),
+            'standards': comp.standards,
+            'file': filename,
+            'saved': time.time(),
+            }
+        self._write_index(index)
+
+
+    def _load(self, key, entry):
+        try:
+            data = np.load(os.path.join(self.path, entry['file']))
+        except (IOError, OSError, ValueError):
+            return None
+        with data:
+            arrays = dict((name, data[name]) for name in data.files)
+        comp = Compensation(entry['fixture'], arrays.pop('frequencies'))
+        for (name, value) in arrays.items():
+            setattr(comp, name, value)
+        return comp
+
+
+    def lookup(self, fixture, frequencies, interpolate = False):
+        # Compensation for fixture on exactly this grid, or with
+        # interpolate, the densest cached grid of fixture covering it.
+        # None when nothing fits.
+        index = self.index()
+        key = '%s-%s' % (fixture, grid_key(frequencies))
+        if key in index:
+            return self._load(key, index[key])
+        if not interpolate:
+            return None
+
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        candidates = sorted(
+                ((entry['points'], key) for (key, entry) in index.items()
+                 if entry['fixture'] == fixture
+                 and entry['min_freq'] <= frequencies.min()
+                 and entry['max_freq'] >= frequencies.max()),
+                reverse=True)
+        for (points, key) in candidates:
+            comp = self._load(key, index[key])
+            if comp is not None:
+                return comp
+        return None
+
+
+    def invalidate(self, fixture, frequencies = None):
+        # drop every grid of fixture, or just the given one
+        index = self.index()
+        grid = None if frequencies is None else grid_key(frequencies)
+        for (key, entry) in list(index.items()):
+            if entry['fixture'] == fixture \
+                    and (grid is None or entry['grid'] == grid):
+                try:
+                    os.unlink(os.path.join(self.path, entry['file']))
+                except OSError:
+                    pass
+                del index[key]
+        if os.path.isdir(self.path):
+            self._write_index(index)
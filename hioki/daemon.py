@@ -0,0 +1,391 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# share one IM3536 session between processes. the daemon owns the
+# hiokiIM3536 connection and serves newline delimited JSON over a unix
+# socket. concurrent measurement requests share a single reading,
+# configuration reads come from the driver cache, and streamed readings are
+# fanned out to every subscriber.
+#
+#   python -m hioki.daemon --socket /tmp/im3536.sock --host 192.168.1.10
+#
+#   client = DaemonClient('/tmp/im3536.sock')
+#   client.get('measurement_frequency')
+#   for reading in client.subscribe(): ...
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from .hiokiIM3536 import ESR0_BitMapping, MeasurementResult
+from .profile import MeasurementProfile
+
+
+def _reply(value):
+    # successful response, a MeasurementResult's status goes next to the
+    # reading rather than into it where it could clash with an item name
+    response = {'ok': True, 'value': value}
+    if isinstance(value, dict):
+        response['value'] = dict(value)
+        status = getattr(value, 'status', None)
+        if status is not None:
+            response['status'] = status
+    return response
+
+
+def _result(response):
+    # client side of _reply for readings
+    value = MeasurementResult(response['value'])
+    value.status = response.get('status')
+    return value
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        daemon = self.server
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if request.get('op') == 'subscribe':
+                    self._stream(daemon, request)
+                    return
+                response = _reply(daemon.handle(request))
+            except Exception as e:
+                response = {'ok': False, 'error': '%s: %s'
+                            % (e.__class__.__name__, e)}
+            self._send(response)
+
+
+    def _send(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+
+    def _stream(self, daemon, request):
+        readings = daemon.subscribe(request.get('backlog', 100))
+        try:
+            while True:
+                self._send(readings.get())
+        except (IOError, OSError):
+            pass
+        finally:
+            daemon.unsubscribe(readings)
+
+
+class InstrumentDaemon(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    "Serves one hiokiIM3536 session to many local clients"
+    daemon_threads = True
+
+    # driver attributes clients may get/set through _get_<name>/_set_<name>
+    Attributes = set([
+        'measurement_frequency', 'mode', 'range', 'autorange',
+        'aquire_speed', 'averaging_setting', 'meas_sig_mode', 'meas_sig_cc',
+        'meas_sig_cv', 'meas_limit_mode', 'meas_limit_c', 'meas_limit_v',
+        'dc_bias_en', 'dc_bias', 'measurement_wait_mode',
+        'identity_instrument_manufacturer', 'identity_instrument_model',
+        'identity_instrument_firmware_revision',
+        ])
+
+    def __init__(self, lcr, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.lcr = lcr
+        self.path = path
+        # one driver call at a time, requests queue on this lock
+        self._io_lock = threading.Lock()
+
+        # measurement coalescing, see measure()
+        self._measure_cond = threading.Condition()
+        self._measure_in_flight = False
+        self._measure_generation = 0
+        self._measure_result = (None, None)
+
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._stream_thread = None
+
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'measure':
+            return self.measure()
+        if op in ('get', 'set'):
+            name = request['name']
+            if name not in self.Attributes:
+                raise ValueError('unknown attribute %s' % name)
+            if op == 'get' and self._cache_valid(name):
+                # answered from the driver cache, no need to queue behind
+                # a measurement for it
+                return getattr(self.lcr, '_' + name)
+            with self._io_lock:
+                if op == 'get':
+                    return getattr(self.lcr, '_get_' + name)()
+                return getattr(self.lcr, '_set_' + name)(request['value'])
+        if op == 'set_measurements':
+            with self._io_lock:
+                return self.lcr._set_measurements(request['items'])
+        if op == 'profile':
+            profile = MeasurementProfile.from_dict(request['profile'])
+            with self._io_lock:
+                return self.lcr._apply_profile(profile)
+        if op == 'get_profile':
+            # cached state only, never touches the instrument
+            return self.lcr._get_profile().to_dict()
+        raise ValueError('unknown op %s' % op)
+
+
+    def _cache_valid(self, name):
+        if name == 'range':
+            # also depends on autorange, see hiokiIM3536._range_cache_valid
+            return self.lcr._range_cache_valid()
+        return self.lcr._get_cache_valid(name)
+
+
+    def measure(self):
+        # one reading. callers arriving while a reading is in flight wait
+        # for it and share its result instead of queueing their own.
+        with self._measure_cond:
+            if self._measure_in_flight:
+                generation = self._measure_generation
+                while self._measure_generation == generation:
+                    self._measure_cond.wait()
+                (value, error) = self._measure_result
+                if error is not None:
+                    raise error
+                return value
+            self._measure_in_flight = True
+
+        value = error = None
+        try:
+            with self._io_lock:
+                value = self.lcr._get_measurements()
+        except Exception as e:
+            error = e
+
+        with self._measure_cond:
+            self._measure_result = (value, error)
+            self._measure_generation += 1
+            self._measure_in_flight = False
+            self._measure_cond.notify_all()
+
+        if error is not None:
+            raise error
+        return value
+
+
+    def subscribe(self, backlog = 100):
+        # returns a queue of responses fed by the stream thread, which runs
+        # while anyone is subscribed. slow subscribers lose their oldest
+        # readings rather than holding up the others.
+        readings = queue.Queue(maxsize=max(int(backlog), 1))
+        with self._subscribers_lock:
+            self._subscribers.add(readings)
+            if self._stream_thread is None:
+                self._stream_thread = threading.Thread(target=self._stream)
+                self._stream_thread.daemon = True
+                self._stream_thread.start()
+        return readings
+
+
+    def unsubscribe(self, readings):
+        with self._subscribers_lock:
+            self._subscribers.discard(readings)
+
+
+    def _stream(self):
+        # fan the readings of a driver MeasurementStream out to the
+        # subscribers. the stream waits for a fresh EOM per reading and
+        # takes the driver's I/O lock per transaction only, so requests
+        # from other clients interleave with it. a stream that fails, eg
+        # after the items were changed under it, is reported and restarted.
+        stream = None
+        while True:
+            with self._subscribers_lock:
+                subscribers = list(self._subscribers)
+                if not subscribers:
+                    if stream is not None:
+                        stream.stop()
+                    self._stream_thread = None
+                    return
+            try:
+                if stream is None:
+                    with self._io_lock:
+                        stream = self.lcr._start_streaming(status = True)
+                batch = stream.read(timeout = 0.1)
+            except Exception as e:
+                if stream is not None:
+                    stream.stop()
+                    stream = None
+                else:
+                    time.sleep(0.1)
+                self._publish(subscribers, {'ok': False, 'error': '%s: %s'
+                                            % (e.__class__.__name__, e)})
+                continue
+
+            items = [field for field in batch.dtype.names
+                     if field not in ('TIMESTAMP', 'STATUS')]
+            for row in batch:
+                response = {'ok': True, 'value': dict(
+                        (item, float(row[item])) for item in items)}
+                if row['STATUS'] >= 0:
+                    response['status'] = self.lcr._decode_event_register(
+                            int(row['STATUS']), ESR0_BitMapping)
+                self._publish(subscribers, response)
+
+
+    def _publish(self, subscribers, response):
+        for readings in subscribers:
+            while True:
+                try:
+                    readings.put_nowait(response)
+                    break
+                except queue.Full:
+                    try:
+                        readings.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+class DaemonClient(object):
+    "Client for InstrumentDaemon"
+
+    def __init__(self, path):
+        self.path = path
+        self._socket = self._connect()
+        self._file = self._socket.makefile('rwb')
+
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+    def _exchange(self, **request):
+        self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._file.flush()
+        response = json.loads(self._file.readline().decode('utf-8'))
+        if not response['ok']:
+            raise IOError(response['error'])
+        return response
+
+
+    def _request(self, **request):
+        return self._exchange(**request)['value']
+
+
+    def get(self, name):
+        return self._request(op='get', name=name)
+
+
+    def set(self, name, value):
+        return self._request(op='set', name=name, value=value)
+
+
+    def set_measurements(self, items):
+        return self._request(op='set_measurements', items=list(items))
+
+
+    def apply_profile(self, profile):
+        return self._request(op='profile', profile=profile.to_dict())
+
+
+    def get_profile(self):
+        return MeasurementProfile.from_dict(self._request(op='get_profile'))
+
+
+    def measure(self):
+        return _result(self._exchange(op='measure'))
+
+
+    def subscribe(self, backlog = 100):
+        # generator of streamed readings on a dedicated connection
+        sock = self._connect()
+        f = sock.makefile('rwb')
+        try:
+            f.write(json.dumps({'op': 'subscribe',
+                                'backlog': backlog}).encode('utf-8') + b'\n')
+            f.flush()
+            for line in f:
+                response = json.loads(line.decode('utf-8'))
+                if not response['ok']:
+                    raise IOError(response['error'])
+                yield _result(response)
+        finally:
+            f.close()
+            sock.close()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='shared IM3536 daemon')
+    parser.add_argument('--socket', default='/tmp/im3536.sock')
+    parser.add_argument('--resource', help='python-ivi resource string')
+    parser.add_argument('--host', help='meter LAN address (raw socket)')
+    parser.add_argument('--port', type=int, default=3500)
+    args = parser.parse_args(argv)
+
+    from .hiokiIM3536 import hiokiIM3536
+    if args.host:
+        from .interface import SocketInstrument
+        lcr = hiokiIM3536(SocketInstrument(args.host, args.port))
+    elif args.resource:
+        lcr = hiokiIM3536(args.resource)
+    else:
+        parser.error('one of --host or --resource is required')
+
+    server = InstrumentDaemon(lcr, args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        lcr.close()
+
+
+if __name__ == '__main__':
+    main()
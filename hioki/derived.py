@@ -0,0 +1,117 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# compute the ParameterMapping quantities from |Z|, phase and frequency
+# instead of asking the meter for each of them.
+# sign conventions follow the IM3536 manual:
+#   Z = R + jX, Y = 1/Z = G + jB, phase in degrees
+import numpy as np
+
+from .buffer import MeasurementBuffer
+
+# the items :MEAS? has to return for derivation to work
+WireParameters = ['IMPEDANCE', 'IMPEDANCE_PHASE_ANGLE']
+
+# items that can be computed from the wire parameters. RDC, conductivity
+# and permittivity need extra information and must come from the meter.
+DerivableParameters = set([
+        'IMPEDANCE',
+        'ADMITTANCE',
+        'IMPEDANCE_PHASE_ANGLE',
+        'REACTANCE',
+        'CONDUCTANCE',
+        'SUBSEPTANCE',
+        'LOSS_FACTOR',
+        'Q_FACTOR',
+        'EQUIVALENT_SERIES_RESISTANCE',
+        'EQUIVALENT_PARALLEL_RESISTANCE',
+        'EQUIVALENT_SERIES_INDUCTANCE',
+        'EQUIVALENT_PARALLEL_INDUCTANCE',
+        'EQUIVALENT_SERIES_CAPACITANCE',
+        'EQUIVALENT_PARALLEL_CAPACITANCE',
+        ])
+
+
+def derive_parameters(impedance, phase, frequency, items):
+    # impedance, phase (degrees), frequency - scalars or equal length arrays
+    # items - DerivableParameters keys to compute
+    # returns dict of item -> float64 array
+    z = np.asarray(impedance, dtype=np.float64)
+    theta = np.radians(np.asarray(phase, dtype=np.float64))
+    omega = 2.0 * np.pi * np.asarray(frequency, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = z * np.cos(theta)
+        x = z * np.sin(theta)
+        g = np.cos(theta) / z
+        b = -np.sin(theta) / z
+
+        calc = {
+            'IMPEDANCE': lambda: z,
+            'ADMITTANCE': lambda: 1.0 / z,
+            'IMPEDANCE_PHASE_ANGLE': lambda: np.degrees(theta),
+            'REACTANCE': lambda: x,
+            'CONDUCTANCE': lambda: g,
+            'SUBSEPTANCE': lambda: b,
+            'LOSS_FACTOR': lambda: np.abs(r / x),
+            'Q_FACTOR': lambda: np.abs(x / r),
+            'EQUIVALENT_SERIES_RESISTANCE': lambda: r,
+            'EQUIVALENT_PARALLEL_RESISTANCE': lambda: 1.0 / g,
+            'EQUIVALENT_SERIES_INDUCTANCE': lambda: x / omega,
+            'EQUIVALENT_PARALLEL_INDUCTANCE': lambda: -1.0 / (omega * b),
+            'EQUIVALENT_SERIES_CAPACITANCE': lambda: -1.0 / (omega * x),
+            'EQUIVALENT_PARALLEL_CAPACITANCE': lambda: b / omega,
+            }
+
+        shape = np.broadcast(z, theta, omega).shape
+        derived = {}
+        for item in items:
+            if item not in DerivableParameters:
+                raise ValueError('%s can not be derived from Z and phase' % item)
+            derived[item] = np.broadcast_to(calc[item](), shape)
+
+    return derived
+
+
+def derive_buffer(buf, items, frequency = None):
+    # buf - MeasurementBuffer holding at least the WireParameters columns
+    # frequency - used when buf has no FREQUENCY column
+    # returns a new MeasurementBuffer with any non-wire leading columns of
+    # buf (eg FREQUENCY) followed by items
+    if 'FREQUENCY' in buf.fields:
+        frequency = buf.column('FREQUENCY')
+    elif frequency is None:
+        raise ValueError('frequency required to derive parameters')
+
+    derived = derive_parameters(buf.column('IMPEDANCE'),
+                                buf.column('IMPEDANCE_PHASE_ANGLE'),
+                                frequency, items)
+
+    extra = [field for field in buf.fields
+             if field not in WireParameters and field not in items]
+    columns = dict((field, buf.column(field)) for field in extra)
+    columns.update(derived)
+
+    return MeasurementBuffer.from_columns(extra + list(items), columns)
@@ -27,23 +27,55 @@ THE SOFTWARE.
 #from .. import ivi
 # While not part of upstream python-ivi distribution.
 import ivi
+import math
+import sys
 import time
+import contextlib
+import threading
 
 
 
 OnOff = set(['ON','OFF'])
+# NORMAL - ivi caching, range only cached while autorange is off
+# TRUST  - nothing else touches the instrument, cached values are used until
+#          invalidated, including range under autorange and saved state
+# OFF    - every read queries the instrument
+CachePolicy = set(['NORMAL','TRUST','OFF'])
 OperationMode = set(['LCR','CONT'])
 MeasurementSignalMode = set(['V','CV', 'CC'])
 AquireSpeed = set(['FAST','MED', 'SLOW', 'SLOW2']) # convert to dict
+SweepStyle = set(['log','linear'])
 
-ComparatorBinMode = set(['','']) #ABSolute/PERcent/DEViation
+ComparatorBinMode = set(['ABS','PER','DEV']) #ABSolute/PERcent/DEViation
+SortingMode = set(['COMP','BIN'])
+BinCount = 10
 OpenCircuitCompensationReturn = set(['OFF','All','SPOT'])
+CompensationMode = set(['OFF','ALL','SPOT'])
+CompensationMapping = {
+        'open': ':CORR:OPEN',
+        'short': ':CORR:SHOR'}
+CableLength = set([0, 1, 2, 4]) # meters
 BeepJudgement = set(['OFF','IN','NG'])
 Beeptone = set(['A','B','C','D'])
 
 TriggerSourceMapping = {
         'external': 'ext',
-        'immediate': 'imm'}
+        'immediate': 'int'}
+
+# :MEASure:VALid bits, what :MEAS? returns
+MeasurementValidMapping = {
+        'values': 1,
+        'comparator': 2,
+        'bin': 4,
+        }
+
+# judgement codes in :MEAS? output. bin results are the bin number, 1 to
+# BinCount, or 0 when the part fits no bin
+ComparatorJudgementMapping = {
+        -1: 'LO',
+        0: 'IN',
+        1: 'HI',
+        }
 
 EventMapping = {
         'event_enable_0': ':ESE0',
@@ -103,18 +135,64 @@ ParameterBitMapping = {
         'PERMITTIVITY': [1,2],
         }
 
-# ESR0_BitMapping = {
-#     'eng of compensation data':0, #CEM
-#     'end of measurement':1, #EOM
-#     'data incorperation end bit':2,#IDX
-#     'inpedance underflow':3, # MUF
-#     'impedance overflow':4, #MOF
-#     'limit oerflow':5, #LOF
-#     "CC and CV overflow":6, #COF
-#     'non gaurenteed accuracy bit':7, #REF
-# }
-#
-# #todo - only return measurement when EOM bit is set
+ESR0_BitMapping = {
+    # :ESR0? measurement event register, name : bitNum
+    'CEM':0, # end of compensation data
+    'EOM':1, # end of measurement
+    'IDX':2, # data incorperation end bit
+    'MUF':3, # impedance underflow
+    'MOF':4, # impedance overflow
+    'LOF':5, # limit overflow
+    'COF':6, # CC and CV overflow
+    'REF':7, # non gaurenteed accuracy bit
+}
+
+StandardEventBitMapping = {
+    # *ESR? standard event status register, name : bitNum
+    'OPC':0, # operation complete
+    'RQC':1, # request control
+    'QYE':2, # query error
+    'DDE':3, # device dependent error
+    'EXE':4, # execution error
+    'CME':5, # command error
+    'URQ':6, # user request
+    'PON':7, # power on
+}
+
+# ESR0 bits that mean the attached reading shouldn't be trusted
+MeasurementErrorFlags = set(['MUF','MOF','LOF','COF','REF'])
+
+# how to wait for a fresh reading before :MEAS?
+#   NONE - don't wait, fetch whatever the meter has
+#   OPC  - block on *OPC?
+#   POLL - poll :ESR0? until EOM is set
+#   SRQ  - route EOM to the ESB0 status byte bit and poll the status byte
+#          (serial poll, or *STB? if the interface has none)
+MeasurementWaitMode = set(['NONE','OPC','POLL','SRQ'])
+
+MinimumMeasurementFrequency = 4.0 # 4 Hz
+MaximumMeasurementFrequency = 8000000.0 # 8 MHz
+
+MemoryCapacity = 32000 # max number of stored measurements (:MEMory)
+PanelCount = 60 # number of panel save slots (:PANel)
+
+# profile setting : (query, write format), the commands behind the
+# setting properties, shared with the profile handshake and hioki.aio
+SettingCommandMapping = {
+    'measurement_frequency': ('FREQ?', 'FREQ %e'),
+    'meas_sig_mode': (':LEV?', ':LEV %s'),
+    'meas_sig_cv': (':LEV:CVOLT?', ':LEV:CVOLT %e'),
+    'meas_sig_cc': (':LEV:CCURR?', ':LEV:CCURR %e'),
+    'meas_limit_mode': (':LIM?', ':LIM %s'),
+    'meas_limit_v': (':LIM:VOLT?', ':LIM:VOLT %e'),
+    'meas_limit_c': (':LIM:CURR?', ':LIM:CURR %e'),
+    'aquire_speed': ('SPEE?', 'SPEE %s'),
+    'averaging_setting': ('AVER?', ':AVER %s'),
+    'autorange': (':RANGE:AUTO?', ':RANGE:AUTO %s'),
+    'range': (':RANGE?', ':RANGE %d'),
+    'dc_bias_en': (':DCBIAS?', ':DCBIAS %s'),
+    'dc_bias': (':DCBIAS:LEV?', ':DCBIAS:LEV %e'),
+}
 
 RangeMapping = {
     #range : rangeNum
@@ -131,6 +209,19 @@ RangeMapping = {
 }
 
 
+class MeasurementResult(dict):
+    "measurement dict, status holds the decoded ESR0 flags if they were read"
+    status = None
+
+    @property
+    def errors(self):
+        # MeasurementErrorFlags set for this reading, None if ESR0 wasn't read
+        if self.status is None:
+            return None
+        return sorted(flag for flag in MeasurementErrorFlags
+                      if self.status.get(flag))
+
+
 class hiokiIM3536(ivi.scpi.common.IdnCommand,
              ivi.scpi.common.ErrorQuery,
              ivi.scpi.common.Reset,
@@ -140,7 +231,23 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     
     def __init__(self, *args, **kwargs):
         self.__dict__.setdefault('_instrument_id', '')
-        
+        # used by _write/_ask and _initialize, which can run from inside
+        # the super constructor
+        self.__dict__.setdefault('_write_queue', None)
+        self.__dict__.setdefault('_batched_writes', 0)
+        self.__dict__.setdefault('_state_cache', None)
+        self.__dict__.setdefault('_constructed', False)
+        # serialises instrument I/O between threads (streaming, pools)
+        self.__dict__.setdefault('_io_lock', threading.RLock())
+        # profiling.IOProfiler, None when instrumentation is off
+        self.__dict__.setdefault('_profiler', None)
+
+        # optional on-disk state cache, see _load_state_cache
+        state_cache = kwargs.pop('state_cache', None)
+        if state_cache is not None:
+            from .statecache import StateCache
+            self._state_cache = StateCache(state_cache)
+
         super(hiokiIM3536, self).__init__(*args, **kwargs)
         
         self._identity_description = "HIOKI IM3536 LCR Meter"
@@ -150,16 +257,29 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         self._identity_instrument_manufacturer = "HIOKI"
         self._identity_instrument_model = "IM3536"
         self._identity_instrument_firmware_revision = ""
+        self._identity_instrument_serial_number = ""
         self._identity_specification_major_version = 0
         self._identity_specification_minor_version = 0
         self._identity_supported_instrument_models = ['IM3536']
 
-        self._minimum_meas_frequency = 4.0  #4 Hz
-        self._maximum_meas_frequency = 8000000.0 # 8 MHz
+        self._minimum_meas_frequency = MinimumMeasurementFrequency
+        self._maximum_meas_frequency = MaximumMeasurementFrequency
 
-        self._mode = 'lcr'
+        self._mode = 'LCR'
         self._measurement_frequency = 1000.0
-        self._measurement_range = 4
+        self._range = 4
+        self._autorange = 'ON'
+        self._aquire_speed = 'MED'
+        self._averaging_setting = 'OFF'
+        self._meas_sig_mode = 'V'
+        self._meas_sig_cv = 1.0
+        self._meas_sig_cc = 0.01
+        self._meas_limit_mode = 'OFF'
+        self._meas_limit_c = 0.1
+        self._meas_limit_v = 5.0
+        self._dc_bias_en = 'OFF'
+        self._dc_bias = 0.0
+        self._cache_policy = 'NORMAL'
         self._measurment_type = 'v'
         self._measurment_level_v = 1
         self._measurment_level_cv = 1
@@ -172,8 +292,34 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
 
         self._rdc_mode_enabled = False
 
+        # decoded :MEAS:ITEM order, kept in step with what we last wrote so
+        # each reading only needs a single :MEAS? round-trip.
+        # None = unknown, re-read from the instrument on next use.
+        self._measurement_item_order_cache = None
+        self._paranoid_measurements = False
+
+        # items computed locally from Z/phase, None = derived mode off.
+        # see _set_derived_measurements
+        self._derived_items = None
+
+        # see MeasurementWaitMode and _wait_end_of_measurement
+        self._measurement_wait_mode = 'NONE'
+        self._measurement_poll_interval = 0.005
+        self._measurement_wait_timeout = 10
+        self._last_measurement_status = None
+
         self._self_test_delay = 5
 
+        # write coalescing, see batch()
+        self._input_buffer_size = 256 # bytes per concatenated message
+
+        # panel number : MeasurementProfile known when it was saved
+        self._panel_profiles = {}
+        self._software_compensation = None
+        self._sorting = None
+        self._range_table = None
+        self._range_lock_fallbacks = 0
+
         self._disable = False
 
         self._add_property('measurement_frequency',
@@ -183,11 +329,158 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
                         ivi.Doc("""
                         Specifies the ac frequency applied to the test device
                         """))
+        self._add_property('mode',
+                        self._get_mode,
+                        self._set_mode,
+                        None,
+                        ivi.Doc("""
+                        Measurement mode, LCR or CONT (continuous)
+                        """))
+        self._add_property('range',
+                        self._get_range,
+                        self._set_range,
+                        None,
+                        ivi.Doc("""
+                        Measurement range number, see RangeMapping. Setting a
+                        range turns autorange off.
+                        """))
+        self._add_property('autorange',
+                        self._get_autorange,
+                        self._set_autorange,
+                        None,
+                        ivi.Doc("""
+                        Automatic range selection, ON or OFF
+                        """))
+        self._add_property('aquire_speed',
+                        self._get_aquire_speed,
+                        self._set_aquire_speed,
+                        None,
+                        ivi.Doc("""
+                        Measurement speed, one of AquireSpeed
+                        """))
+        self._add_property('averaging_setting',
+                        self._get_averaging_setting,
+                        self._set_averaging_setting,
+                        None,
+                        ivi.Doc("""
+                        Number of readings averaged (1-256) or OFF
+                        """))
+        self._add_property('meas_sig_mode',
+                        self._get_meas_sig_mode,
+                        self._set_meas_sig_mode,
+                        None,
+                        ivi.Doc("""
+                        Measurement signal level mode, one of
+                        MeasurementSignalMode
+                        """))
+        self._add_property('meas_sig_cv',
+                        self._get_meas_sig_cv,
+                        self._set_meas_sig_cv,
+                        None,
+                        ivi.Doc("""
+                        Constant voltage signal level in volts
+                        """))
+        self._add_property('meas_sig_cc',
+                        self._get_meas_sig_cc,
+                        self._set_meas_sig_cc,
+                        None,
+                        ivi.Doc("""
+                        Constant current signal level in amps
+                        """))
+        self._add_property('meas_limit_mode',
+                        self._get_meas_limit_mode,
+                        self._set_meas_limit_mode,
+                        None,
+                        ivi.Doc("""
+                        Signal limit function, ON or OFF
+                        """))
+        self._add_property('meas_limit_v',
+                        self._get_meas_limit_v,
+                        self._set_meas_limit_v,
+                        None,
+                        ivi.Doc("""
+                        Voltage limit in volts
+                        """))
+        self._add_property('meas_limit_c',
+                        self._get_meas_limit_c,
+                        self._set_meas_limit_c,
+                        None,
+                        ivi.Doc("""
+                        Current limit in amps
+                        """))
+        self._add_property('dc_bias_en',
+                        self._get_dc_bias_en,
+                        self._set_dc_bias_en,
+                        None,
+                        ivi.Doc("""
+                        DC bias output, ON or OFF
+                        """))
+        self._add_property('dc_bias',
+                        self._get_dc_bias,
+                        self._set_dc_bias,
+                        None,
+                        ivi.Doc("""
+                        DC bias level in volts
+                        """))
+        self._add_property('cache_policy',
+                        self._get_cache_policy,
+                        self._set_cache_policy,
+                        None,
+                        ivi.Doc("""
+                        Attribute cache policy, one of CachePolicy. TRUST is
+                        for setups where nothing else (front panel, other
+                        sessions) changes the instrument, reads are then only
+                        sent after the cache is invalidated.
+                        """))
+        self._add_property('paranoid_measurements',
+                        self._get_paranoid_measurements,
+                        self._set_paranoid_measurements,
+                        None,
+                        ivi.Doc("""
+                        When True every reading waits on *OPC? and re-reads
+                        :MEAS:ITEM? before fetching :MEAS?. When False (default)
+                        the item order cached from the last :MEAS:ITEM write is
+                        used and each reading is a single :MEAS? query.
+                        """))
+        self._add_property('measurement_wait_mode',
+                        self._get_measurement_wait_mode,
+                        self._set_measurement_wait_mode,
+                        None,
+                        ivi.Doc("""
+                        How readings wait for end of measurement (EOM) before
+                        :MEAS?. One of NONE, OPC, POLL, SRQ. POLL and SRQ also
+                        attach the ESR0 overflow/underflow flags to each
+                        result as its status attribute.
+                        """))
+        self._add_property('measurement_poll_interval',
+                        self._get_measurement_poll_interval,
+                        self._set_measurement_poll_interval,
+                        None,
+                        ivi.Doc("""
+                        Seconds between :ESR0? (POLL) or status byte (SRQ)
+                        polls while waiting for end of measurement. 0 polls
+                        back to back at the cost of bus traffic.
+                        """))
+        self._add_property('measurement_wait_timeout',
+                        self._get_measurement_wait_timeout,
+                        self._set_measurement_wait_timeout,
+                        None,
+                        ivi.Doc("""
+                        Seconds to wait for end of measurement under POLL and
+                        SRQ before raising MaxTimeoutExceededException. None
+                        waits forever, eg for externally triggered readings.
+                        """))
 
         #make bitsorted list of above dict keys
         self.sortedParameterBitMappingKeys = \
             self._generate_sorted_param_map_keys(ParameterBitMapping)
 
+        # initialize from the constructor ran before the defaults above were
+        # set, so the state cache is only applied now
+        self._constructed = True
+        if self._initialized and self._state_cache is not None \
+                and not self._driver_operation_simulate:
+            self._load_state_cache()
 
 
     # FIXME: Most of the stuff in this class is wrong, blindly copied from
@@ -197,6 +490,11 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     def _initialize(self, resource = None, id_query = False, reset = False, **keywargs):
         "Opens an I/O session to the instrument."
 
+        state_cache = keywargs.pop('state_cache', None)
+        if state_cache is not None:
+            from .statecache import StateCache
+            self._state_cache = StateCache(state_cache)
+
         super(hiokiIM3536, self)._initialize(resource, id_query, reset, **keywargs)
 
         self._interface.term_char = '\r' #doesn't use '\n'
@@ -218,10 +516,111 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
             self._utility_reset()
             self.write(':PRES') # presets for initialising instrument. actually needed?
 
+        # new session, item register may have been changed from the panel
+        self._measurement_item_order_cache = None
+
+        if self._constructed and self._state_cache is not None \
+                and not self._driver_operation_simulate:
+            self._load_state_cache()
+
         #instrument automatically enters remote control state whenever we write to it
         #self._write(":pres") # returns to known preset values. a "factory reset"
 
 
+    def _write(self, data, encoding = 'utf-8'):
+        # inside batch() single commands are queued and sent later as
+        # ';' separated messages
+        with self._io_lock:
+            if self._write_queue is not None and isinstance(data, str):
+                self._write_queue.append(data)
+                self._batched_writes += 1
+                return
+            profiler = self._profiler
+            if profiler is None:
+                super(hiokiIM3536, self)._write(data, encoding)
+                return
+            start = (time.perf_counter(), time.thread_time())
+            super(hiokiIM3536, self)._write(data, encoding)
+            profiler.record('write', data, 0,
+                            time.perf_counter() - start[0],
+                            time.thread_time() - start[1])
+
+
+    def _ask(self, data, num=-1, encoding = 'utf-8'):
+        # queries need everything written before them to have been sent
+        with self._io_lock:
+            queue = self._write_queue
+            if queue is not None:
+                self._flush_write_queue()
+                self._write_queue = None
+            try:
+                profiler = self._profiler
+                if profiler is None:
+                    return super(hiokiIM3536, self)._ask(data, num, encoding)
+                start = (time.perf_counter(), time.thread_time())
+                resp = super(hiokiIM3536, self)._ask(data, num, encoding)
+                profiler.record('ask', data, len(resp),
+                                time.perf_counter() - start[0],
+                                time.thread_time() - start[1])
+                return resp
+            finally:
+                self._write_queue = queue
+
+
+    def _flush_write_queue(self):
+        # join queued commands with ';' into as few messages as fit in the
+        # instrument input buffer. every command gets a leading ':' so it is
+        # parsed from the root node, not relative to the previous command.
+        queue = self._write_queue
+        if not queue:
+            return
+        self._write_queue = None
+        try:
+            message = ''
+            for cmd in queue:
+                if cmd[:1] not in (':', '*'):
+                    cmd = ':' + cmd
+                if message and len(message) + 1 + len(cmd) > self._input_buffer_size:
+                    self._write(message)
+                    message = cmd
+                elif message:
+                    message = message + ';' + cmd
+                else:
+                    message = cmd
+            if message:
+                self._write(message)
+        finally:
+            del queue[:]
+            self._write_queue = queue
+
+
+    @contextlib.contextmanager
+    def batch(self):
+        # coalesce configuration writes, eg
+        #   with lcr.batch():
+        #       lcr._set_measurement_frequency(1e3)
+        #       lcr._set_meas_sig_cv(0.5)
+        # setters update the property cache as usual, the writes are sent
+        # concatenated on exit followed by a single *OPC?.
+        # nested batches join the outermost one.
+        if self._write_queue is not None:
+            yield self
+            return
+
+        self._write_queue = []
+        self._batched_writes = 0
+        try:
+            yield self
+        finally:
+            try:
+                self._flush_write_queue()
+            finally:
+                self._write_queue = None
+
+        if self._batched_writes and not self._driver_operation_simulate:
+            self._wait_cmd_processing_finished()
+
+
     def _load_id_string(self):
         if self._driver_operation_simulate:
             self._identity_instrument_manufacturer = "Not available while simulating"
@@ -231,6 +630,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
             lst = self._ask("*IDN?").split(",")
             self._identity_instrument_manufacturer = lst[0]
             self._identity_instrument_model = lst[1]
+            self._identity_instrument_serial_number = lst[2]
             self._identity_instrument_firmware_revision = lst[3]
             self._set_cache_valid(True, 'identity_instrument_manufacturer')
             self._set_cache_valid(True, 'identity_instrument_model')
@@ -275,6 +675,8 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
             self._write("*RST")
             self._clear()
             self.driver_operation.invalidate_all_attributes()
+            self._measurement_item_order_cache = None
+            self._invalidate_state_cache()
 
 
     def _utility_Initialize(self):
@@ -282,6 +684,129 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
             self._write(":PRES")
             self._clear()
             self.driver_operation.invalidate_all_attributes()
+            self._measurement_item_order_cache = None
+            self._invalidate_state_cache()
+
+
+    def _close(self):
+        if self._initialized:
+            try:
+                self._save_state_cache()
+            except (IOError, OSError, ivi.IviException):
+                pass
+        super(hiokiIM3536, self)._close()
+
+
+    def _state_cache_key(self):
+        if not self._identity_instrument_serial_number:
+            self._load_id_string()
+        return ','.join([self._identity_instrument_manufacturer,
+                         self._identity_instrument_model,
+                         self._identity_instrument_serial_number,
+                         self._identity_instrument_firmware_revision])
+
+
+    def _load_state_cache(self):
+        # restore cached settings saved by a previous session for this exact
+        # instrument (serial and firmware from *IDN?). one extra query checks
+        # every cached setting still matches before trusting it, skipped
+        # under the TRUST cache policy.
+        # returns True if the cache was used.
+        from .profile import MeasurementProfile, restore_profile_cache
+
+        self._load_id_string()
+        key = self._state_cache_key()
+        entry = self._state_cache.load(key)
+        if entry is None:
+            return False
+
+        profile = MeasurementProfile.from_dict(entry.get('profile', {}))
+        if self._cache_policy != 'TRUST' and not self._check_state(profile):
+            self._state_cache.invalidate(key)
+            return False
+
+        restore_profile_cache(self, profile)
+        self._panel_profiles = dict(
+            (int(num), MeasurementProfile.from_dict(d))
+            for (num, d) in entry.get('panels', {}).items())
+        return True
+
+
+    def _check_state(self, profile):
+        # compare the instrument against profile with a single concatenated
+        # query covering every field restore_profile_cache will mark valid.
+        # fields the profile doesn't set are not checked, nor is range while
+        # autorange may be moving it.
+        from .profile import ProfileFieldMapping
+
+        fields = [field for field in ProfileFieldMapping
+                  if getattr(profile, field) is not None
+                  and not (field == 'range' and profile.autorange != 'OFF')]
+        queries = [SettingCommandMapping[field][0] for field in fields]
+        if profile.measurement_items is not None:
+            queries.append(':MEAS:ITEM?')
+        if not queries:
+            return True
+
+        message = ';'.join(q if q[0] in ':*' else ':' + q for q in queries)
+        resp = self._ask(message).split(';')
+        if len(resp) != len(queries):
+            return False
+
+        for (field, value) in zip(fields, resp):
+            value_type = ProfileFieldMapping[field][3]
+            expected = getattr(profile, field)
+            value = value.split()[-1].upper()
+            try:
+                if value_type is float:
+                    if not math.isclose(float(value), expected,
+                                        rel_tol = 1e-4, abs_tol = 1e-12):
+                        return False
+                elif field == 'averaging_setting':
+                    if value != str(expected).upper():
+                        return False
+                elif value_type is int:
+                    if int(value) != expected:
+                        return False
+                elif {'1': 'ON', '0': 'OFF'}.get(value, value) \
+                        != str(expected).upper():
+                    return False
+            except ValueError:
+                return False
+
+        if profile.measurement_items is not None:
+            itemEnBytes = [int(i) for i in resp[-1].replace(',',' ').split()]
+            expected = [item for item in self.sortedParameterBitMappingKeys
+                        if item in profile.measurement_items]
+            try:
+                if self._decode_measurement_item_order(itemEnBytes) != expected:
+                    return False
+            except ivi.IOException:
+                return False
+
+        return True
+
+
+    def _save_state_cache(self):
+        # write what the driver currently knows to the state cache, done
+        # automatically on close
+        if self._state_cache is None or self._driver_operation_simulate:
+            return
+        self._state_cache.save(self._state_cache_key(), {
+            'profile': self._get_profile().to_dict(),
+            'panels': dict((str(num), profile.to_dict()) for (num, profile)
+                           in self._panel_profiles.items()),
+            })
+
+
+    def _invalidate_state_cache(self):
+        # settings were reset on the instrument, the saved state is stale
+        if self._state_cache is None:
+            return
+        try:
+            self._state_cache.invalidate(self._state_cache_key())
+        except (IOError, OSError):
+            pass
 
 
     def _utility_reset_with_defaults(self):
@@ -313,6 +838,35 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         #print(resp)
         return
 
+    def _get_cache_tag(self, tag=None, skip=1):
+        # same as ivi.Driver._get_cache_tag, but walks frames directly. the
+        # stock version builds a full inspect.stack() on every cached read,
+        # which costs far more than the read it saves.
+        if tag is None:
+            try:
+                tag = sys._getframe(skip).f_code.co_name
+            except ValueError:
+                return ''
+
+        if tag[0:4] == "_get": tag = tag[4:]
+        if tag[0:4] == "_set": tag = tag[4:]
+        if tag[0] == "_": tag = tag[1:]
+
+        return tag
+
+
+    def _get_cache_policy(self):
+        return self._cache_policy
+
+
+    def _set_cache_policy(self, value):
+        value = str(value).upper()
+        if value not in CachePolicy:
+            raise ivi.ValueNotSupportedException()
+        self._cache_policy = value
+        self._driver_operation_cache = value != 'OFF'
+
+
     #Measurement Mode
     def _get_mode(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
@@ -324,10 +878,11 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
 
     def _set_mode(self, value):
         #value can = LCR, CONT (continuous)
+        value = str(value).upper()
         if value not in OperationMode:
             raise ivi.ValueNotSupportedException()
         if not self._driver_operation_simulate:
-            self._write("MODE %e" % (value))
+            self._write("MODE %s" % (value))
         self._mode = value
         self._set_cache_valid()
 
@@ -335,7 +890,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     #measurement frequency
     def _get_measurement_frequency(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask("FREQ?").split()[0]
+            resp = self._ask(SettingCommandMapping['measurement_frequency'][0]).split()[0]
             self._measurement_frequency = float(resp)
             self._set_cache_valid()
         return self._measurement_frequency
@@ -346,62 +901,84 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         if not self._minimum_meas_frequency <= value <= self._maximum_meas_frequency:
             raise ivi.InvalidOptionValueException()
         if not self._driver_operation_simulate:
-            self._write("FREQ %e" % (value))
+            self._write(SettingCommandMapping['measurement_frequency'][1] % (value))
         self._measurement_frequency = value
         self._set_cache_valid()
 
 
     #measurement range
     def _get_range(self):
-        if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":RANGE?").split()[0]
-            #self.range = float(resp)
-            #self._set_cache_valid()
-        return resp
+        if not self._driver_operation_simulate and not self._range_cache_valid():
+            resp = self._ask(SettingCommandMapping['range'][0]).split()[-1]
+            self._range = int(resp)
+            self._set_cache_valid(True, 'range')
+        return self._range
+
+    def _range_cache_valid(self):
+        # under autorange the range follows the device, so a cached value is
+        # only good when autorange is known to be off (or we're told to trust)
+        if not self._get_cache_valid('range'):
+            return False
+        if self._cache_policy == 'TRUST':
+            return True
+        return self._get_cache_valid('autorange') and self._autorange == 'OFF'
 
     def _set_range(self, value):
-        #value = float(value)
+        value = int(value)
+        if value not in RangeMapping.values():
+            raise ivi.OutOfRangeException()
         if not self._driver_operation_simulate:
-            self._write(":RANGE %e" % (value))
-        #self._range = value
+            self._write(SettingCommandMapping['range'][1] % (value))
+        self._range = value
         self._set_cache_valid()
+        # selecting a range turns autorange off on the instrument
+        self._autorange = 'OFF'
+        self._set_cache_valid(True, 'autorange')
 
         #measurement range
     def _get_autorange(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":RANGE:AUTO?").split()[0]
-            #self._set_cache_valid()
-        return resp
+            resp = self._ask(SettingCommandMapping['autorange'][0]).split()[-1]
+            self._autorange = {'1': 'ON', '0': 'OFF'}.get(resp, resp.upper())
+            self._set_cache_valid()
+        return self._autorange
 
     def _set_autorange(self, value):
+        if value is True or value is False:
+            value = 'ON' if value else 'OFF'
+        value = str(value).upper()
         if value not in OnOff:
             raise ivi.ValueNotSupportedException()
         if not self._driver_operation_simulate:
-            self._write(":RANGE:AUTO %e" % (value))
-        #self._set_cache_valid()
+            self._write(SettingCommandMapping['autorange'][1] % (value))
+        self._autorange = value
+        self._set_cache_valid()
+        if value == 'ON':
+            self._set_cache_valid(False, 'range')
 
 #Measurement aquiration Speed
     def _get_aquire_speed(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask("SPEE?").split()[1]
+            resp = self._ask(SettingCommandMapping['aquire_speed'][0]).split()[-1]
             self._aquire_speed = resp
             self._set_cache_valid()
         return self._aquire_speed
 
 
     def _set_aquire_speed(self, value):
-        if value not in self.AquireSpeed:
+        value = str(value).upper()
+        if value not in AquireSpeed:
             raise ivi.InvalidOptionValueException()
         if not self._driver_operation_simulate:
-            self._write("SPEE %e" % (value))
+            self._write(SettingCommandMapping['aquire_speed'][1] % (value))
         self._aquire_speed = value
         self._set_cache_valid()
 
 # averaging_setting
     def _get_averaging_setting(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask("AVER?").split()[1]
-            self._averaging_setting = resp
+            resp = self._ask(SettingCommandMapping['averaging_setting'][0]).split()[-1].upper()
+            self._averaging_setting = resp if resp == 'OFF' else int(resp)
             self._set_cache_valid()
         return self._averaging_setting
 
@@ -409,13 +986,15 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     def _set_averaging_setting(self, value):
         #setting value to 1 or 'off' turns averaging off
 
-        if value is 'off' or value is None or value is False:
-            value = 'off'
-        elif  1 <= int(value) <= 256:
+        if value is None or value is False or str(value).upper() == 'OFF':
+            value = 'OFF'
+        elif not 1 <= int(value) <= 256:
             raise ivi.InvalidOptionValueException()
+        else:
+            value = int(value)
 
         if not self._driver_operation_simulate:
-            self._write(":AVER %e" % (value))
+            self._write(SettingCommandMapping['averaging_setting'][1] % (value))
         self._averaging_setting = value
         self._set_cache_valid()
         return
@@ -426,7 +1005,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     #Measurement Signal Level mode
     def _get_meas_sig_mode(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":LEV?").split(' ')[0]
+            resp = self._ask(SettingCommandMapping['meas_sig_mode'][0]).split(' ')[0]
             self._set_cache_valid()
             self._meas_sig_mode = resp
         return self._meas_sig_mode
@@ -437,7 +1016,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         if value not in MeasurementSignalMode:
             raise ivi.InvalidOptionValueException()
         if not self._driver_operation_simulate:
-            self._write(":LEV %e" % (value))
+            self._write(SettingCommandMapping['meas_sig_mode'][1] % (value))
         self._meas_sig_mode = value
         self._set_cache_valid()
 
@@ -445,7 +1024,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         #Measurement Signal Constant current
     def _get_meas_sig_cc(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":LEV:CCURR?").split(' ')[0]
+            resp = self._ask(SettingCommandMapping['meas_sig_cc'][0]).split(' ')[0]
             self._set_cache_valid()
             self._meas_sig_cc = float(resp)
         return self._meas_sig_cc
@@ -455,7 +1034,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         value = float(value)
         #if  <= value <= : ivi.InvalidOptionValueException() # add error checking
         if not self._driver_operation_simulate:
-            self._write(":LEV:CCURR %e" % (value))
+            self._write(SettingCommandMapping['meas_sig_cc'][1] % (value))
         self._meas_sig_cc = value
         self._set_cache_valid()
 
@@ -463,7 +1042,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     #Measurement Signal Constant voltage
     def _get_meas_sig_cv(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":LEV:CVOLT?").split(' ')[0]
+            resp = self._ask(SettingCommandMapping['meas_sig_cv'][0]).split(' ')[0]
             self._set_cache_valid()
             self._meas_sig_cv = float(resp)
         return self._meas_sig_cv
@@ -473,7 +1052,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         value = float(value)
         #if  <= value <= : ivi.InvalidOptionValueException() # add error checking
         if not self._driver_operation_simulate:
-            self._write(":LEV:CVOLT %e" % (value))
+            self._write(SettingCommandMapping['meas_sig_cv'][1] % (value))
         self._meas_sig_cv = value
         self._set_cache_valid()
 
@@ -482,7 +1061,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     #Measurement Signal Level mode
     def _get_meas_limit_mode(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":LIM?").split(' ')[0]
+            resp = self._ask(SettingCommandMapping['meas_limit_mode'][0]).split(' ')[0]
             self._set_cache_valid()
             self._meas_limit_mode = resp
         return self._meas_limit_mode
@@ -493,7 +1072,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         if value not in OnOff:
             raise ivi.InvalidOptionValueException()
         if not self._driver_operation_simulate:
-            self._write(":LIM %e" % (value))
+            self._write(SettingCommandMapping['meas_limit_mode'][1] % (value))
         self._meas_limit_mode = value
         self._set_cache_valid()
 
@@ -501,7 +1080,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     #Measurement Signal Constant current limit
     def _get_meas_limit_c(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":LIM:CURR?").split(' ')[0]
+            resp = self._ask(SettingCommandMapping['meas_limit_c'][0]).split(' ')[0]
             self._set_cache_valid()
             self._meas_limit_c = float(resp)
         return self._meas_limit_c
@@ -511,7 +1090,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         value = float(value)
         #if  <= value <= : ivi.InvalidOptionValueException() # add error checking
         if not self._driver_operation_simulate:
-            self._write(":LIM:CURR %e" % (value))
+            self._write(SettingCommandMapping['meas_limit_c'][1] % (value))
         self._meas_limit_c = value
         self._set_cache_valid()
 
@@ -519,7 +1098,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     #Measurement Signal Constant voltage limit
     def _get_meas_limit_v(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":LIM:VOLT?").split(' ')[0]
+            resp = self._ask(SettingCommandMapping['meas_limit_v'][0]).split(' ')[0]
             self._set_cache_valid()
             self._meas_limit_v = float(resp)
         return self._meas_limit_v
@@ -529,7 +1108,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         value = float(value)
         #if  <= value <= : ivi.InvalidOptionValueException() # add error checking
         if not self._driver_operation_simulate:
-            self._write(":LIM:VOLT %e" % (value))
+            self._write(SettingCommandMapping['meas_limit_v'][1] % (value))
         self._meas_limit_v = value
         self._set_cache_valid()
 
@@ -537,23 +1116,27 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
     #dc bias functions
     def _get_dc_bias_en(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":DCBIAS").split(' ')[1]
-            self._dc_bias_en = resp
+            resp = self._ask(SettingCommandMapping['dc_bias_en'][0]).split()[-1]
+            self._dc_bias_en = {'1': 'ON', '0': 'OFF'}.get(resp, resp.upper())
             self._set_cache_valid()
         return self._dc_bias_en
 
 
     def _set_dc_bias_en(self, value):
-        #value = bool(value)
+        if value is True or value is False:
+            value = 'ON' if value else 'OFF'
+        value = str(value).upper()
+        if value not in OnOff:
+            raise ivi.ValueNotSupportedException()
         if not self._driver_operation_simulate:
-            self._write(":DCBIAS %d" % (value))
+            self._write(SettingCommandMapping['dc_bias_en'][1] % (value))
         self._dc_bias_en = value
         self._set_cache_valid()
 
 
     def _get_dc_bias(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
-            resp = self._ask(":DCBIAS:LEV?").split(' ')[0]
+            resp = self._ask(SettingCommandMapping['dc_bias'][0]).split(' ')[0]
             self._dc_bias = float(resp)
             self._set_cache_valid()
         return self._dc_bias
@@ -563,7 +1146,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         value = float(value)
         #if  <= value <= : ivi.InvalidOptionValueException() # add error checking
         if not self._driver_operation_simulate:
-            self._write(":DCBIAS:LEV %e" % (value))
+            self._write(SettingCommandMapping['dc_bias'][1] % (value))
         self._dc_bias = value
         self._set_cache_valid()
 
@@ -594,11 +1177,20 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         if len(itemEnBytes) is not 3:
             raise ivi.ValueNotSupportedException()
 
+        # drop the cached order first so a failed write can't leave it stale
+        self._measurement_item_order_cache = None
+
         self._write(':MEAS:ITEM {mr0!s:s},{mr1!s:s},{mr2!s:s}'
                     .format(mr0=itemEnBytes[0],
                             mr1=itemEnBytes[1],
                             mr2=itemEnBytes[2]))
 
+        # all zero goes back to returning the default display values, there
+        # is no order to cache until items are set again
+        if any(itemEnBytes):
+            self._measurement_item_order_cache = \
+                self._decode_measurement_item_order(itemEnBytes)
+
 
     def _get_measurement_items(self):
         itemEnBytes = self._ask(':MEAS:ITEM?').replace(',',' ').split()
@@ -628,12 +1220,9 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
         return self.sortedParameterBitMappingKeys
 
 
-    def _get_measurement_item_order(self):
-        #read back item register set and populate measure order list
-        #self._expected_meas_order = ['parameter1', 'parameter2', ..etc]
-
-        #get bits of enabled results
-        itemEnBytes = self._get_measurement_items()
+    def _decode_measurement_item_order(self, itemEnBytes):
+        # turn the 3 :MEAS:ITEM register bytes into the list of parameter
+        # names in the order :MEAS? returns them.
 
         # if all en bytes are 0 we have no data to use
         # (in actuality, this isn't true, it just returns disply
@@ -642,39 +1231,285 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
                 raise ivi.IOException('no measurement order possible '
                                       'as no measurements configured')
 
-        self._expected_meas_order = []
+        order = []
         #check if parameter is enabled and add it to the list if so.
         for item in self.sortedParameterBitMappingKeys:
             itembits = ParameterBitMapping[item]
 
             if itemEnBytes[itembits[1]] & (0x01 << itembits[0]):
-                self._expected_meas_order.append(item)
+                order.append(item)
+
+        return order
+
+
+    def _get_measurement_item_order(self):
+        #read back item register set and populate measure order list
+        #self._expected_meas_order = ['parameter1', 'parameter2', ..etc]
+
+        #get bits of enabled results
+        itemEnBytes = self._get_measurement_items()
+
+        self._expected_meas_order = \
+            self._decode_measurement_item_order(itemEnBytes)
+        self._measurement_item_order_cache = self._expected_meas_order
 
         return self._expected_meas_order
 
 
+    def _get_paranoid_measurements(self):
+        return self._paranoid_measurements
+
+
+    def _set_paranoid_measurements(self, value):
+        self._paranoid_measurements = bool(value)
+
+
     def _get_measurements(self):
         # get measurements and assign with keys.
         # fails when no measurements configured
 
-        self._wait_sampling_finished() #blocks until measurement ready
+        if self._paranoid_measurements:
+            # original behaviour, three round-trips per reading
+            self._wait_sampling_finished() #blocks until measurement ready
+            self._get_measurement_item_order()
+
+        return self._fetch_measurements()
+
 
+    def _fetch_measurements(self):
+        # single :MEAS? using the cached item order. shared by
+        # _get_measurements and the sweep/acquisition paths.
+        profiler = self._profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        status = self._wait_end_of_measurement()
+
+        order = self._measurement_item_order_cache
+        if order is None:
+            order = self._get_measurement_item_order()
+
+        if profiler is not None:
+            waited = time.perf_counter()
         # paralell arrays. order contains designation, resp contains data
-        order = self._get_measurement_item_order()
-        resp = self._ask(":MEAS?").replace(',',' ').split()
+        resp = self._ask(":MEAS?")
+        if profiler is not None:
+            queried = time.perf_counter()
+        resp = resp.replace(',',' ').split()
         #print (resp) #debug
 
         #if we don't get the # of values we expect, something is wrong
         if len(resp) != len(order):
-            raise ivi.IOException('data config doesnt match data recieved')
-
-        self._last_measurement_set = {}
+            # item register changed behind our back (front panel, another
+            # session). re-read it once before giving up.
+            order = self._get_measurement_item_order()
+            if len(resp) != len(order):
+                self._measurement_item_order_cache = None
+                raise ivi.IOException('data config doesnt match data recieved')
+
+        self._last_measurement_set = MeasurementResult()
         for (item, value) in zip(order, resp):
             self._last_measurement_set[item] = float(value)
 
+        if self._derived_items is not None:
+            self._last_measurement_set = MeasurementResult(
+                self._derive_measurement_set(self._last_measurement_set))
+
+        self._last_measurement_status = status
+        if status is not None:
+            self._last_measurement_set.status = \
+                self._decode_event_register(status, ESR0_BitMapping)
+
+        if profiler is not None:
+            profiler.record_reading(start, waited, queried,
+                                    time.perf_counter())
         return self._last_measurement_set
 
 
+    def _new_measurement_buffer(self, extra_fields = (), capacity = 1024,
+                                status = None):
+        # MeasurementBuffer whose columns are extra_fields followed by the
+        # active measurement items in sortedParameterBitMappingKeys order.
+        # status - add a trailing STATUS column with the raw ESR0 value of
+        #          each reading. defaults to on when the wait mode reads ESR0
+        from .buffer import MeasurementBuffer
+
+        order = self._measurement_item_order_cache
+        if order is None:
+            order = self._get_measurement_item_order()
+
+        if status is None:
+            status = self._measurement_wait_mode in ('POLL', 'SRQ')
+        fields = list(extra_fields) + order
+        if status:
+            fields.append('STATUS')
+
+        return MeasurementBuffer(fields, capacity)
+
+
+    def _fetch_measurements_into(self, buf, extra = ()):
+        # columnar version of _fetch_measurements. parses one :MEAS? straight
+        # into the next row of buf (see _new_measurement_buffer), no
+        # per-reading dict is created. extra fills the leading extra_fields.
+        from .buffer import parse_values
+
+        profiler = self._profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        status = self._wait_end_of_measurement()
+        if profiler is not None:
+            waited = time.perf_counter()
+        resp = self._ask(":MEAS?")
+        if profiler is not None:
+            queried = time.perf_counter()
+        values = parse_values(resp)
+        offset = len(extra)
+        end = len(buf.fields)
+        if buf.fields[-1] == 'STATUS':
+            end -= 1
+        if len(values) != end - offset:
+            raise ivi.IOException('data config doesnt match data recieved')
+
+        row = buf.new_row()
+        row[:offset] = extra
+        row[offset:end] = values
+        if end != len(buf.fields):
+            row[end] = -1 if status is None else status
+        self._last_measurement_status = status
+        if profiler is not None:
+            profiler.record_reading(start, waited, queried,
+                                    time.perf_counter())
+        return buf
+
+
+    def _get_measurements_array(self, count, buf = None):
+        # take count readings into a MeasurementBuffer
+        if buf is None:
+            buf = self._new_measurement_buffer(capacity = count)
+        for i in range(int(count)):
+            self._fetch_measurements_into(buf)
+        return self._derive_buffer(buf)
+
+
+    def _start_streaming(self, capacity = 65536, status = None,
+                         max_errors = 10):
+        # keep the meter measuring on a background thread, writing
+        # timestamped readings into a preallocated ring buffer. returns the
+        # MeasurementStream; read it with .batches()/iteration, check
+        # .overruns, and .stop() it when done. other driver calls can be
+        # made meanwhile, they interleave with the stream on the I/O lock.
+        # the wait mode is POLL (or SRQ) until the stream stops.
+        from .stream import MeasurementStream
+        return MeasurementStream(self, capacity, status, max_errors).start()
+
+
+    def _set_derived_measurements(self, items):
+        # derived parameters mode. only IMPEDANCE and IMPEDANCE_PHASE_ANGLE
+        # are requested from the meter, everything else in items is computed
+        # locally (see derived.py) and returned under the same names.
+        # call _set_measurements to go back to meter computed values.
+        from .derived import DerivableParameters, WireParameters
+
+        for item in items:
+            if item not in DerivableParameters:
+                raise ivi.ValueNotSupportedException(item)
+
+        self._set_measurements(WireParameters)
+        self._derived_items = list(items)
+
+
+    def _derive_measurement_set(self, measurement_set, frequency = None):
+        from .derived import derive_parameters
+
+        if frequency is None:
+            frequency = self._get_measurement_frequency()
+        derived = derive_parameters(measurement_set['IMPEDANCE'],
+                                    measurement_set['IMPEDANCE_PHASE_ANGLE'],
+                                    frequency, self._derived_items)
+
+        return dict((item, float(derived[item])) for item in self._derived_items)
+
+
+    def _derive_buffer(self, buf):
+        # whole-batch version of _derive_measurement_set. buffers without a
+        # FREQUENCY column use the current measurement frequency.
+        # software compensation, if set, is applied first.
+        if self._derived_items is None and self._software_compensation is None:
+            return buf
+
+        frequency = None
+        if 'FREQUENCY' not in buf.fields:
+            frequency = self._get_measurement_frequency()
+        if self._software_compensation is not None:
+            buf = self._software_compensation.correct_buffer(buf, frequency)
+        if self._derived_items is None:
+            return buf
+        from .derived import derive_buffer
+        return derive_buffer(buf, self._derived_items, frequency)
+
+
+    def _get_profile(self):
+        # MeasurementProfile of the settings the driver currently knows,
+        # fields without a valid cached value are None
+        from .profile import get_profile
+        return get_profile(self)
+
+
+    def _apply_profile(self, profile):
+        # write only the fields of profile that differ from the cached state,
+        # batched into as few messages as possible. returns the names of the
+        # fields that were written.
+        from .profile import apply_profile
+        return apply_profile(self, profile)
+
+
+    def _panel_save(self, number, name = ''):
+        # store the current setup in on-board panel number (1-PanelCount).
+        # the driver also remembers what it knew about the setup so a later
+        # _panel_load can refresh the cache without querying.
+        number = int(number)
+        if not 1 <= number <= PanelCount:
+            raise ivi.OutOfRangeException()
+        if not self._driver_operation_simulate:
+            self._write(':PAN:SAVE %d,"%s"' % (number, name[:10]))
+        self._panel_profiles[number] = self._get_profile()
+
+
+    def _panel_load(self, number):
+        # recall panel number in one command. cached settings are refreshed
+        # from what was known at save time, anything else the panel covers
+        # is invalidated. identity and other attributes are left alone.
+        from .profile import invalidate_profile_cache, restore_profile_cache
+
+        number = int(number)
+        if not 1 <= number <= PanelCount:
+            raise ivi.OutOfRangeException()
+        if not self._driver_operation_simulate:
+            self._write(':PAN:LOAD %d' % (number))
+
+        profile = self._panel_profiles.get(number)
+        if profile is None:
+            invalidate_profile_cache(self)
+        else:
+            restore_profile_cache(self, profile)
+
+
+    def _panel_clear(self, number):
+        number = int(number)
+        if not 1 <= number <= PanelCount:
+            raise ivi.OutOfRangeException()
+        if not self._driver_operation_simulate:
+            self._write(':PAN:CLE %d' % (number))
+        self._panel_profiles.pop(number, None)
+
+
+    def _get_panel_name(self, number):
+        # returns '' for an empty panel
+        number = int(number)
+        if not 1 <= number <= PanelCount:
+            raise ivi.OutOfRangeException()
+        return self._ask(':PAN:NAME? %d' % (number)).strip().strip('"')
+
+
     def _set_measurements(self, items):
         #dev.lcr.set_measurement_items([ 'CONDUCTANCE','IMPEDANCE'])
 
@@ -691,6 +1526,7 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
 
         #save after successful write
         self._current_meas_items = items
+        self._derived_items = None
 
 
     def do_lcr_measurement(self, frequency, parameters,
@@ -706,6 +1542,468 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
             self.set_display_item(items[itemNum], itemNum)
 
 
+    def _set_speed_step(self, step):
+        # (speed, averaging) ladder step, only writing what changes
+        (speed, averaging) = step
+        if self._aquire_speed != speed:
+            self._set_aquire_speed(speed)
+        if self._averaging_setting != averaging:
+            self._set_averaging_setting(averaging)
+
+
+    def _adaptive_sweep(self, frequencies, budget = None, parameters = None):
+        # frequency sweep that picks speed/averaging per point from an
+        # adaptive.NoiseBudget. readings are repeated at a point, moving up
+        # the budget's ladder only while the running scatter of the judged
+        # item is over target. returns a MeasurementBuffer of FREQUENCY,
+        # the mean of each item over the readings at the final step, and
+        # SPEED (SpeedLevels index), AVERAGING (0 = OFF), READINGS and
+        # UNCERTAINTY (relative standard error of the judged item).
+        # the speed and averaging in use before are restored afterwards.
+        from .adaptive import NoiseBudget, SpeedLevels
+        from .buffer import MeasurementBuffer
+
+        if parameters is not None:
+            self._set_measurements(parameters)
+        if budget is None:
+            budget = NoiseBudget()
+        scratch = self._new_measurement_buffer(capacity = budget.max_readings,
+                                               status = False)
+        column = scratch.fields.index(budget.pick_item(scratch.fields))
+        width = len(scratch.fields)
+        buf = MeasurementBuffer(['FREQUENCY'] + scratch.fields
+                                + ['SPEED', 'AVERAGING', 'READINGS',
+                                   'UNCERTAINTY'], len(frequencies))
+
+        previous = (self._get_aquire_speed(), self._get_averaging_setting())
+        mode = self._measurement_wait_mode
+        if mode in ('NONE', 'OPC'):
+            # every reading has to be a new measurement
+            self._measurement_wait_mode = 'POLL'
+        try:
+            for freq in frequencies:
+                freq = round(freq, 3)
+                self._set_measurement_frequency(freq)
+                self._set_speed_step(budget.ladder[budget.start_point()])
+                self._get_event_register(0)
+                scratch.clear()
+                total = 0
+                while True:
+                    self._fetch_measurements_into(scratch)
+                    total += 1
+                    verdict = budget.add(scratch.rows[-1][column], total)
+                    if verdict == 'done':
+                        break
+                    if verdict == 'escalate':
+                        scratch.clear()
+                        self._set_speed_step(budget.ladder[budget.step])
+                        self._get_event_register(0)
+
+                (speed, averaging) = budget.ladder[budget.step]
+                row = buf.new_row()
+                row[0] = freq
+                row[1:width + 1] = scratch.rows.mean(axis = 0)
+                row[width + 1:] = (SpeedLevels.index(speed),
+                                   0 if averaging == 'OFF' else averaging,
+                                   total, budget.stats.relative_uncertainty)
+        finally:
+            self._measurement_wait_mode = mode
+            self._set_speed_step(previous)
+
+        return self._derive_buffer(buf)
+
+
+    def _enable_profiling(self, callback = None, reading_callback = None):
+        # start timing every message and reading, returns the
+        # profiling.IOProfiler collecting them (see there for callbacks)
+        from .profiling import IOProfiler
+        self._profiler = IOProfiler(callback, reading_callback)
+        return self._profiler
+
+
+    def _disable_profiling(self):
+        # stop timing, returns the profiler with what it collected
+        profiler = self._profiler
+        self._profiler = None
+        return profiler
+
+
+    def _learn_ranges(self, frequencies, key, parameters = None):
+        # measure once at each frequency under autorange and record the
+        # range the meter chose, returns a rangelock.RangeTable for key
+        from .rangelock import RangeTable
+
+        if parameters is not None:
+            self._set_measurements(parameters)
+        table = RangeTable(key)
+        self._set_autorange('ON')
+        # wait for a reading autorange has settled on at every point
+        with self._fresh_readings():
+            for freq in frequencies:
+                freq = round(freq, 3)
+                self._set_measurement_frequency(freq)
+                self._clear_end_of_measurement()
+                self._fetch_measurements()
+                # always read back, the cached range is stale under
+                # autorange even when the cache policy trusts it
+                self._set_cache_valid(False, 'range')
+                table.record(freq, self._get_range())
+        return table
+
+
+    def _set_range_lock(self, table):
+        # pin the learned range of a rangelock.RangeTable at every sweep
+        # point. points the table doesn't know, or that read back as over
+        # or under range (ESR0 MOF/MUF), are measured under autorange and
+        # the range found is added to the table. None goes back to
+        # autorange.
+        self._range_table = table
+        if table is None:
+            self._set_autorange('ON')
+
+
+    def _apply_range_lock(self, freq):
+        num = self._range_table.lookup(freq)
+        if num is None:
+            if self._autorange != 'ON':
+                self._set_autorange('ON')
+        elif self._autorange != 'OFF' or self._range != num:
+            self._set_range(num)
+
+
+    def _range_lock_check(self, freq):
+        # after a reading at freq. True when it was off scale on the pinned
+        # range, autorange is then on and the reading has to be repeated.
+        if self._autorange == 'ON':
+            self._set_cache_valid(False, 'range')
+            self._range_table.record(freq, self._get_range())
+            return False
+        status = self._last_measurement_status
+        if status is None:
+            status = int(self._ask(':ESR0?').split()[0])
+        off_scale = (0x01 << ESR0_BitMapping['MOF']) \
+            | (0x01 << ESR0_BitMapping['MUF'])
+        if not status & off_scale:
+            return False
+        self._range_lock_fallbacks += 1
+        self._set_autorange('ON')
+        return True
+
+
+    def _range_locked(self, freq, fetch, discard = None):
+        # fetch() one reading at freq on the learned range. discard()
+        # throws away an off scale reading before it is retaken.
+        # the off scale check reads the ESR0 of this very reading, so the
+        # fetch always waits for a new EOM
+        with self._fresh_readings():
+            self._apply_range_lock(freq)
+            self._clear_end_of_measurement()
+            result = fetch()
+            if self._range_lock_check(freq):
+                if discard is not None:
+                    discard()
+                self._clear_end_of_measurement()
+                result = fetch()
+                self._range_lock_check(freq)
+        return result
+
+
+    def _generate_sweep_points(self, start, stop, steps, style = 'log'):
+        # list of frequencies from start to stop (inclusive)
+        # style - 'log' or 'linear', see SweepStyle
+        if style not in SweepStyle:
+            raise ivi.ValueNotSupportedException(style)
+        steps = int(steps)
+        if steps < 1:
+            raise ivi.OutOfRangeException()
+        if steps == 1:
+            return [float(start)]
+
+        if style == 'log':
+            ratio = float(stop) / float(start)
+            return [float(start) * ratio ** (float(i) / (steps - 1))
+                    for i in range(steps)]
+        span = float(stop) - float(start)
+        return [float(start) + span * i / (steps - 1) for i in range(steps)]
+
+
+    def _frequency_sweep(self, frequencies, parameters = None):
+        # generator, yields (frequency, measurement dict) per point.
+        # frequencies - any iterable of points, see _generate_sweep_points
+        # parameters - optional list of ParameterBitMapping keys to configure
+        #              before sweeping. otherwise the current items are used.
+        #
+        # each point costs one FREQ write and one :MEAS? query; the item
+        # order is resolved once up front and *OPC? is not used.
+        if parameters is not None:
+            self._set_measurements(parameters)
+        elif self._measurement_item_order_cache is None:
+            self._get_measurement_item_order()
+
+        for freq in frequencies:
+            freq = round(freq, 3)
+            self._set_measurement_frequency(freq)
+            if self._range_table is None:
+                self._clear_end_of_measurement()
+                yield (freq, self._fetch_measurements())
+            else:
+                yield (freq, self._range_locked(freq,
+                                                self._fetch_measurements))
+
+
+    def _acquire_to_memory(self, count, speed = 'FAST',
+                           poll_interval = 0.05, timeout = None,
+                           columnar = False):
+        # let the meter free-run into its internal memory and pull the whole
+        # buffer back with a single :MEM? query. returns a list of
+        # measurement dicts in the same ParameterBitMapping order as
+        # _get_measurements.
+        # count - number of measurements to capture, up to MemoryCapacity
+        # speed - AquireSpeed to run at, None leaves the current setting
+        # timeout - seconds to wait for the buffer to fill, None = forever
+        # columnar - return a MeasurementBuffer instead of a list of dicts
+        count = int(count)
+        if not 1 <= count <= MemoryCapacity:
+            raise ivi.OutOfRangeException()
+
+        order = self._measurement_item_order_cache
+        if order is None:
+            order = self._get_measurement_item_order()
+
+        # the meter has to free run while filling memory, trigger source
+        # and speed are put back as they were afterwards
+        source = self._get_trigger_source()
+        previous_speed = None
+        if speed is not None:
+            previous_speed = self._get_aquire_speed()
+        try:
+            if speed is not None:
+                self._set_aquire_speed(speed)
+            self._write(':MEM:CLE')
+            if source != 'immediate':
+                self._set_trigger_source('immediate')
+            self._write(':MEM IN')
+
+            start = time.time()
+            try:
+                while self._get_memory_count() < count:
+                    if timeout is not None and time.time() - start > timeout:
+                        raise ivi.MaxTimeoutExceededException()
+                    time.sleep(poll_interval)
+            finally:
+                # stop storing before the readout so the buffer can't grow
+                # while we're transferring it
+                self._write(':MEM OFF')
+
+            resp = self._ask(':MEM?')
+        finally:
+            if source != 'immediate':
+                self._set_trigger_source(source)
+            if previous_speed is not None \
+                    and previous_speed != self._aquire_speed:
+                self._set_aquire_speed(previous_speed)
+
+        if columnar:
+            from .buffer import MeasurementBuffer, parse_values
+            values = parse_values(resp)
+            if len(values) % len(order) != 0:
+                raise ivi.IOException('data config doesnt match data recieved')
+            buf = MeasurementBuffer(order, len(values) // len(order))
+            buf.extend(values)
+            buf.truncate(count)
+            return self._derive_buffer(buf)
+
+        resp = resp.replace(',',' ').split()
+        block = self._parse_measurement_block(resp, order)[:count]
+        if self._derived_items is not None:
+            frequency = self._get_measurement_frequency()
+            block = [self._derive_measurement_set(reading, frequency)
+                     for reading in block]
+        return block
+
+
+    def _get_memory_count(self):
+        return int(self._ask(':MEM:COUN?').split()[0])
+
+
+    def _parse_measurement_block(self, resp, order):
+        # split a flat list of value tokens (several readings back to back)
+        # into measurement dicts keyed by order
+        width = len(order)
+        if len(resp) % width != 0:
+            raise ivi.IOException('data config doesnt match data recieved')
+
+        block = []
+        for i in range(0, len(resp), width):
+            reading = {}
+            for (item, value) in zip(order, resp[i:i + width]):
+                reading[item] = float(value)
+            block.append(reading)
+
+        return block
+
+
+    def _frequency_sweep_array(self, frequencies, parameters = None,
+                               buf = None):
+        # columnar version of _frequency_sweep, returns a MeasurementBuffer
+        # with a leading FREQUENCY column. pass buf to append to an existing
+        # buffer with the same columns.
+        if parameters is not None:
+            self._set_measurements(parameters)
+        if buf is None:
+            buf = self._new_measurement_buffer(['FREQUENCY'],
+                                               len(frequencies))
+
+        for freq in frequencies:
+            freq = round(freq, 3)
+            self._set_measurement_frequency(freq)
+            if self._range_table is None:
+                self._clear_end_of_measurement()
+                self._fetch_measurements_into(buf, (freq,))
+            else:
+                self._range_locked(
+                    freq, lambda: self._fetch_measurements_into(buf, (freq,)),
+                    lambda: buf.truncate(len(buf) - 1))
+
+        return self._derive_buffer(buf)
+
+
+    def _run_sweep_plan(self, plan, parameters = None, bias_settle = 0.0):
+        # measure every point of a planner.SweepPlan in its planned order,
+        # only changing the settings that differ from the previous point.
+        # returns a structured array of plan.shape (bias, level, frequency)
+        # with BIAS, LEVEL, FREQUENCY and item fields. levels go to CC or CV
+        # by the signal mode (V is switched to CV). DC bias is switched off
+        # again at the end.
+        # bias_settle - seconds to wait after each bias change, or a
+        #               settle.SettleDetector to wait for readings to settle
+        from .planner import SweepAxes
+
+        if parameters is not None:
+            self._set_measurements(parameters)
+        buf = self._new_measurement_buffer(SweepAxes, len(plan))
+        scratch = None
+        if not isinstance(bias_settle, (int, float)):
+            scratch = self._new_measurement_buffer(capacity = 1)
+
+        set_level = None
+        sig_mode = None
+        biased = False
+        indices = []
+        try:
+            for (index, bias, level, freq) in plan.steps():
+                if bias is not None:
+                    if not biased:
+                        self._set_dc_bias_en('ON')
+                        biased = True
+                    self._set_dc_bias(bias)
+                    if scratch is not None:
+                        self._wait_settled(bias_settle, scratch)
+                    elif bias_settle:
+                        time.sleep(bias_settle)
+                if level is not None:
+                    if set_level is None:
+                        if self._get_meas_sig_mode() == 'V':
+                            sig_mode = 'V'
+                            self._set_meas_sig_mode('CV')
+                        set_level = self._set_meas_sig_cv
+                        if self._get_meas_sig_mode() == 'CC':
+                            set_level = self._set_meas_sig_cc
+                    set_level(level)
+                if freq is not None:
+                    self._set_measurement_frequency(round(freq, 3))
+                point = plan.points[index]
+                if self._range_table is None:
+                    self._clear_end_of_measurement()
+                    self._fetch_measurements_into(buf, point)
+                else:
+                    self._range_locked(
+                        round(point[2], 3),
+                        lambda: self._fetch_measurements_into(buf, point),
+                        lambda: buf.truncate(len(buf) - 1))
+                indices.append(index)
+        finally:
+            if biased:
+                self._control_dc_bias(False, 0)
+            if sig_mode is not None:
+                self._set_meas_sig_mode(sig_mode)
+
+        return plan.assemble(self._derive_buffer(buf).data, indices)
+
+
+    def _wait_settled(self, settle, scratch):
+        # take readings into scratch, a one row buffer from
+        # _new_measurement_buffer, until the settle.SettleDetector converges
+        # or times out. scratch keeps the last reading.
+        # returns (seconds waited, settled, readings taken)
+        # every reading has to be a new measurement, so ESR0 EOM is polled
+        # unless the wait mode already does that
+        item = settle.pick_item(scratch.fields)
+        settle.reset()
+        with self._fresh_readings():
+            # an EOM latched before the setting change isn't a new reading
+            self._get_event_register(0)
+            start = time.time()
+            count = 0
+            while True:
+                scratch.clear()
+                self._fetch_measurements_into(scratch)
+                count += 1
+                elapsed = time.time() - start
+                if settle.add(scratch.column(item)[0]) \
+                        and elapsed >= settle.min_wait:
+                    return (elapsed, True, count)
+                if elapsed >= settle.max_wait:
+                    return (elapsed, False, count)
+                if settle.interval:
+                    time.sleep(settle.interval)
+
+
+    def _bias_sweep(self, biases, parameters = None, settle = None,
+                    buf = None, callback = None):
+        # C-V style sweep over DC bias at the current frequency and level.
+        # after each bias step readings are repeated until they settle (see
+        # settle.SettleDetector, defaults to 0.1% over 3 readings) and the
+        # settled reading is kept. returns a MeasurementBuffer of BIAS,
+        # SETTLE_TIME, SETTLED (0/1), READINGS and the measurement items.
+        # callback(buf) is called after every point for live display.
+        # bias is switched off at the end.
+        from .settle import SettleDetector
+
+        if parameters is not None:
+            self._set_measurements(parameters)
+        if settle is None:
+            settle = SettleDetector()
+        extra = ['BIAS', 'SETTLE_TIME', 'SETTLED', 'READINGS']
+        scratch = self._new_measurement_buffer(capacity = 1)
+        if buf is None:
+            buf = self._new_measurement_buffer(extra, len(biases))
+
+        try:
+            self._set_dc_bias_en('ON')
+            for bias in biases:
+                self._set_dc_bias(bias)
+                (elapsed, settled, count) = self._wait_settled(settle, scratch)
+                row = buf.new_row()
+                row[:len(extra)] = (bias, elapsed, settled, count)
+                row[len(extra):] = scratch.rows[0]
+                if callback is not None:
+                    callback(buf)
+        finally:
+            self._control_dc_bias(False, 0)
+
+        return self._derive_buffer(buf)
+
+
+    def _planned_sweep(self, frequencies, levels = None, biases = None,
+                       parameters = None, cost = None, method = 'auto',
+                       bias_settle = 0.0):
+        # plan and run a frequency x level x bias sweep, see planner.py
+        from .planner import SweepPlan
+        plan = SweepPlan(frequencies, levels, biases, cost, method)
+        return self._run_sweep_plan(plan, parameters, bias_settle)
+
+
     #implemented in _set_meas_sig_mode and assosiated functions
     # def _set_measurement_powers(self, vac, iac, vdc, idc):
     #     self.write('')
@@ -728,30 +2026,388 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
 
 
 
-    # ESR0_BitMapping = {
-    #     'eng of compensation data':0, #CEM
-    #     'end of measurement':1, #EOM
-    #     'data incorperation end bit':2,#IDX
-    #     'inpedance underflow':3, # MUF
-    #     'impedance overflow':4, #MOF
-    #     'limit oerflow':5, #LOF
-    #     "CC and CV overflow":6, #COF
-    #     'non gaurenteed accuracy bit':7, #REF
-    # }
-    #
-    # #todo - only return measurement when EOM bit is set
+    def _decode_event_register(self, value, mapping = None):
+        # register value -> dict of name : bool. registers without a known
+        # mapping decode to 'BIT0'..'BIT7'
+        if mapping is None:
+            mapping = dict(('BIT%d' % bit, bit) for bit in range(8))
+        return dict((name, bool(value & (0x01 << bit)))
+                    for (name, bit) in mapping.items())
 
-    def _get_event_register(self):
-        self.esrContents = self._ask('*esr?')
-        #todo map to dict of bits
+
+    def _get_event_register(self, register = None):
+        # register - None for the standard *ESR?, or 0-3 for :ESR0?-:ESR3?
+        # reading a register clears it on the instrument.
+        if register is None:
+            self.esrContents = int(self._ask('*ESR?').split()[0])
+            return self._decode_event_register(self.esrContents,
+                                               StandardEventBitMapping)
+
+        if register not in range(0, 4):
+            raise ivi.ValueNotSupportedException()
+        value = int(self._ask(EventMapping['event_status_%d' % register]
+                              + '?').split()[0])
+        if register == 0:
+            return self._decode_event_register(value, ESR0_BitMapping)
+        return self._decode_event_register(value)
+
+
+    def _set_event_enable(self, register, bits):
+        # bits - int mask or list of names from ESR0_BitMapping
+        if register not in range(0, 4):
+            raise ivi.ValueNotSupportedException()
+        if not isinstance(bits, int):
+            bits = sum(0x01 << ESR0_BitMapping[name] for name in bits)
+        self._write('%s %d' % (EventMapping['event_enable_%d' % register],
+                               bits))
+
+
+    def _set_service_request_enable(self, mask):
+        self._write('*SRE %d' % mask)
+
+
+    def _get_measurement_wait_mode(self):
+        return self._measurement_wait_mode
+
+
+    def _get_measurement_poll_interval(self):
+        return self._measurement_poll_interval
+
+
+    def _set_measurement_poll_interval(self, value):
+        value = float(value)
+        if value < 0:
+            raise ivi.OutOfRangeException()
+        self._measurement_poll_interval = value
+
+
+    def _get_measurement_wait_timeout(self):
+        return self._measurement_wait_timeout
+
+
+    def _set_measurement_wait_timeout(self, value):
+        if value is not None:
+            value = float(value)
+            if value <= 0:
+                raise ivi.OutOfRangeException()
+        self._measurement_wait_timeout = value
+
+
+    def _set_measurement_wait_mode(self, value):
+        value = str(value).upper()
+        if value not in MeasurementWaitMode:
+            raise ivi.ValueNotSupportedException()
+        if value == 'SRQ' and not self._driver_operation_simulate:
+            # EOM -> ESB0 summary bit (status byte bit 0) -> SRQ
+            self._set_event_enable(0, ['EOM'])
+            self._set_service_request_enable(0x01)
+        self._measurement_wait_mode = value
+
+
+    def _wait_end_of_measurement(self):
+        # wait for a fresh reading according to _measurement_wait_mode.
+        # returns the raw ESR0 value seen while waiting, or None when the
+        # mode doesn't read ESR0 (NONE/OPC).
+        # note ESR0 latches, so an EOM from a measurement that completed
+        # before the last setting change can still satisfy POLL/SRQ, see
+        # _clear_end_of_measurement.
+        mode = self._measurement_wait_mode
+        if mode == 'NONE' or self._driver_operation_simulate:
+            return None
+        if mode == 'OPC':
+            self._wait_sampling_finished()
+            return None
+
+        eom = 0x01 << ESR0_BitMapping['EOM']
+        timeout = self._measurement_wait_timeout
+        start = time.time()
+
+        if mode == 'SRQ':
+            # EOM sets the ESB0 summary bit, the status byte can be polled
+            # without clearing ESR0 so only one :ESR0? is sent per reading
+            esb0 = 0x01
+            while not int(self._read_stb()) & esb0:
+                if timeout is not None and time.time() - start > timeout:
+                    raise ivi.MaxTimeoutExceededException()
+                if self._measurement_poll_interval:
+                    time.sleep(self._measurement_poll_interval)
+            return int(self._ask(':ESR0?').split()[0])
+
+        status = 0
+        while True:
+            status |= int(self._ask(':ESR0?').split()[0])
+            if status & eom:
+                return status
+            if timeout is not None and time.time() - start > timeout:
+                raise ivi.MaxTimeoutExceededException()
+            if self._measurement_poll_interval:
+                time.sleep(self._measurement_poll_interval)
+
+
+    @contextlib.contextmanager
+    def _fresh_readings(self):
+        # readings taken in the block wait for a new EOM, NONE and OPC are
+        # switched to POLL until it exits
+        mode = self._measurement_wait_mode
+        if mode in ('NONE', 'OPC'):
+            self._measurement_wait_mode = 'POLL'
+        try:
+            yield
+        finally:
+            self._measurement_wait_mode = mode
+
+
+    def _clear_end_of_measurement(self):
+        # drop a latched EOM after a setting change so POLL/SRQ wait for a
+        # reading taken on the new settings
+        if self._measurement_wait_mode in ('POLL', 'SRQ') \
+                and not self._driver_operation_simulate:
+            self._get_event_register(0)
+
+
+    def _run_compensation(self, kind, mode = 'ALL', timeout = 120,
+                          poll_interval = 0.2):
+        # run the meter's own open or short compensation with the fixture
+        # already open/shorted, and turn it on. blocks until ESR0 reports
+        # end of compensation data (CEM).
+        if kind not in CompensationMapping or mode not in ('ALL', 'SPOT'):
+            raise ivi.ValueNotSupportedException()
+        self._get_event_register(0) # clear a stale CEM
+        self._write('%s %s' % (CompensationMapping[kind], mode))
+
+        cem = 0x01 << ESR0_BitMapping['CEM']
+        start = time.time()
+        while not int(self._ask(':ESR0?').split()[0]) & cem:
+            if time.time() - start > timeout:
+                raise ivi.MaxTimeoutExceededException()
+            time.sleep(poll_interval)
+
+
+    def _get_compensation(self, kind):
+        if kind not in CompensationMapping:
+            raise ivi.ValueNotSupportedException()
+        return self._ask(CompensationMapping[kind] + '?').split()[-1].upper()
+
+
+    def _set_compensation(self, kind, mode):
+        # 'OFF' disables the meter's compensation of that kind, ALL/SPOT
+        # reuse the data it already holds
+        if kind not in CompensationMapping or mode not in CompensationMode:
+            raise ivi.ValueNotSupportedException()
+        self._write('%s %s' % (CompensationMapping[kind], mode))
+
+
+    def _get_cable_length(self):
+        return int(self._ask(':CORR:CABL?').split()[-1])
+
+
+    def _set_cable_length(self, length):
+        if length not in CableLength:
+            raise ivi.ValueNotSupportedException()
+        self._write(':CORR:CABL %d' % length)
+
+
+    def _capture_compensation(self, frequencies, count = 1):
+        # measure whatever standard is on the fixture (open, short or load)
+        # at each frequency for software compensation. returns the complex
+        # impedance per frequency, averaged over count readings. the
+        # measurement items are restored afterwards.
+        # capture with the meter's own compensation OFF or it is applied twice
+        from .compensation import to_complex
+        from .derived import WireParameters
+
+        items = getattr(self, '_current_meas_items', None)
+        derived = self._derived_items
+        comp = self._software_compensation
+        self._software_compensation = None
+        try:
+            self._set_measurements(WireParameters)
+            z = []
+            for i in range(int(count)):
+                buf = self._frequency_sweep_array(frequencies)
+                z.append(to_complex(buf.column('IMPEDANCE'),
+                                    buf.column('IMPEDANCE_PHASE_ANGLE')))
+        finally:
+            self._software_compensation = comp
+            if derived is not None:
+                self._set_derived_measurements(derived)
+            elif items is not None:
+                self._set_measurements(items)
+        return sum(z) / len(z)
+
+
+    def _set_software_compensation(self, comp):
+        # compensation.Compensation applied to every columnar result (sweep
+        # arrays, _get_measurements_array, memory acquisitions). those need
+        # IMPEDANCE and IMPEDANCE_PHASE_ANGLE among the items, or derived
+        # mode. None turns it off.
+        self._software_compensation = comp
+
+
+    def _get_trigger_source(self):
+        resp = self._ask(':TRIG?').split()[-1].lower()
+        for (source, value) in TriggerSourceMapping.items():
+            if resp.startswith(value):
+                return source
+        return resp
+
+
+    def _set_trigger_source(self, source):
+        # 'immediate' - free running, 'external' - a measurement per EXT I/O
+        # TRIG pulse (or *TRG, see _trigger)
+        if source not in TriggerSourceMapping:
+            raise ivi.ValueNotSupportedException()
+        self._write(':TRIG %s' % TriggerSourceMapping[source].upper())
+
+
+    def _trigger(self):
+        # software trigger for the external trigger source
+        self._write('*TRG')
+
+
+    def _set_beep_judgement(self, mode):
+        if mode not in BeepJudgement:
+            raise ivi.ValueNotSupportedException()
+        self._write(':BEEP:JUDG %s' % mode)
+
+
+    def _format_limits(self, mode, low, high, reference):
+        # arguments of a :COMP/:BIN limit command
+        if mode not in ComparatorBinMode:
+            raise ivi.ValueNotSupportedException()
+        if mode == 'ABS':
+            return '%s,%s' % (low, high)
+        if reference is None:
+            raise ivi.ValueNotSupportedException('reference required for %s'
+                                                 % mode)
+        return '%s,%s,%s' % (reference, low, high)
+
+
+    def _set_comparator_limits(self, item, low, high, mode = 'ABS',
+                               reference = None):
+        # judge item (shown as display parameter 1) against low/high.
+        # mode - ABS: low, high are values
+        #        PER: percent of reference
+        #        DEV: offsets from reference
+        self._set_display_item(1, item)
+        self._write(':COMP:FLIM:%s %s'
+                    % (mode, self._format_limits(mode, low, high, reference)))
+
+
+    def _set_bin_limits(self, item, bins, mode = 'ABS', reference = None):
+        # bins - up to BinCount (low, high) pairs for item, bin 1 first.
+        # unused bins are switched off.
+        if len(bins) > BinCount:
+            raise ivi.OutOfRangeException()
+        self._set_display_item(1, item)
+        with self.batch():
+            for num in range(1, BinCount + 1):
+                if num <= len(bins):
+                    (low, high) = bins[num - 1]
+                    self._write(':BIN:FLIM:%s %d,%s' % (mode, num,
+                                self._format_limits(mode, low, high,
+                                                    reference)))
+                else:
+                    self._write(':BIN:FLIM:%s %d,OFF' % (mode, num))
+
+
+    def _start_sorting(self, item, mode = 'COMP', primary = True):
+        # production sorting. program limits first with
+        # _set_comparator_limits / _set_bin_limits, then this switches the
+        # meter to the judgement, measures item only, and waits on the
+        # external trigger. every :MEAS? then returns just the value of item
+        # (if primary) and the judgement code, see _read_judgement.
+        if mode not in SortingMode or item not in ParameterBitMapping:
+            raise ivi.ValueNotSupportedException()
+        valid = MeasurementValidMapping['comparator' if mode == 'COMP'
+                                        else 'bin']
+        if primary:
+            valid |= MeasurementValidMapping['values']
+
+        # everything changed here is put back by _stop_sorting
+        self._sorting = (mode, primary, self._measurement_wait_mode,
+                         self._get_measurement_items(),
+                         getattr(self, '_current_meas_items', None),
+                         self._derived_items,
+                         self._get_trigger_source())
+        with self.batch():
+            self._write(':%s ON' % mode)
+            self._write(':MEAS:VAL %d' % valid)
+            self._set_measurements([item])
+            self._set_trigger_source('external')
+        # free running reads would return the previous part
+        if self._measurement_wait_mode in ('NONE', 'OPC'):
+            self._set_measurement_wait_mode('POLL')
+        # drop an EOM left over from before the trigger source changed
+        self._get_event_register(0)
+
+
+    def _stop_sorting(self):
+        if self._sorting is None:
+            return
+        (mode, primary, wait_mode, item_bytes, items, derived_items,
+         source) = self._sorting
+        with self.batch():
+            self._write(':%s OFF' % mode)
+            self._write(':MEAS:VAL %d' % MeasurementValidMapping['values'])
+            self._set_measurement_items(item_bytes)
+            self._set_trigger_source(source)
+        self._current_meas_items = items
+        self._derived_items = derived_items
+        self._set_measurement_wait_mode(wait_mode)
+        self._sorting = None
+
+
+    def _read_judgement(self, timeout = None):
+        # wait for the next triggered part, returns (value, code).
+        # value is None when sorting without primary.
+        # timeout - seconds to wait for the part, None waits until one comes
+        if self._sorting is None:
+            raise ivi.OperationNotSupportedException('sorting not started')
+        wait_timeout = self._measurement_wait_timeout
+        self._measurement_wait_timeout = timeout
+        try:
+            self._last_measurement_status = self._wait_end_of_measurement()
+        finally:
+            self._measurement_wait_timeout = wait_timeout
+        resp = self._ask(':MEAS?').replace(',', ' ').split()
+        code = int(float(resp[-1]))
+        value = float(resp[0]) if self._sorting[1] else None
+        return (value, code)
+
+
+    def _sort_parts(self, count = None, timeout = None):
+        # generator of (value, code) per part until count parts
+        while count is None or count > 0:
+            yield self._read_judgement(timeout)
+            if count is not None:
+                count -= 1
+
+
+    def _sort_parts_array(self, count, buf = None, timeout = None):
+        # count parts into a MeasurementBuffer of VALUE, JUDGEMENT (and
+        # STATUS under POLL/SRQ)
+        from .buffer import MeasurementBuffer
+        if buf is None:
+            fields = ['VALUE', 'JUDGEMENT']
+            if self._measurement_wait_mode in ('POLL', 'SRQ'):
+                fields.append('STATUS')
+            buf = MeasurementBuffer(fields, count)
+        for i in range(int(count)):
+            (value, code) = self._read_judgement(timeout)
+            row = buf.new_row()
+            row[0] = float('nan') if value is None else value
+            row[1] = code
+            if len(buf.fields) > 2:
+                status = self._last_measurement_status
+                row[2] = -1 if status is None else status
+        return buf
 
 
     # TODO
     # dc measurement options
-    # Open Circuit Compensation
-    # Short Circuit Compensation
-    # Load Compensation
-    # Cable length compensation
+    # Load Compensation (meter side, software load compensation is in
+    #                    compensation.py)
     # HIGH- Z reject
     # Display on/off
     # SOUND
@@ -762,61 +2418,45 @@ class hiokiIM3536(ivi.scpi.common.IdnCommand,
 
 
 
-    #useful utility function/s
-    # def csv_frequency_sweep(lcr, filepath, min_freq, max_freq,
-    #                     steps, parameters, style = 'log'):
-    # # creates csv file of parameters over frequency
-    # # style - log or linear - not implemented yet - replace range function
-    # # steps = number of descrete steps
-    #
-    # # example
-    # # csv_frequency_sweep(lcr, 'lcrCSVtest.csv', 100, 1000, 100,['IMPEDANCE'])
-    #
-    # import numpy as np
-    # import csv
-    #
-    # #open file
-    # print('creating new csv in ' + filepath)
-    # with open(filepath, 'w', newline = '') as csvfile:
-    #     frequency_column_header = 'FREQUENCY'
-    #
-    #     #create 'ordered' list for header and data order
-    #     headerlist = [frequency_column_header]
-    #     headerlist.extend(parameters)
-    #     print(headerlist)
-    #
-    #     writer = csv.DictWriter(csvfile, fieldnames=headerlist)
-    #     writer.writeheader()
-    #
-    #     lcr._set_measurement_items(parameters)
-    #
-    #     #select linear or logrithmic scales
-    #     if style == 'log':
-    #         sweepPoints = np.logspace(np.log10(min_freq),
-    #                                   np.log10(max_freq),
-    #                                   num=steps)
-    #     elif style == 'linear':
-    #         sweepPoints = np.linspace(min_freq,
-    #                                   max_freq,
-    #                                   num=steps)
-    #     else:
-    #         raise Exception('Style: {st!s:s} not supported'.format(st=style))
-    #
-    #     #print(sweepPoints)
-    #
-    #     #collect data
-    #     for step in sweepPoints:
-    #         freq = round(step, 3)
-    #         lcr._set_measurement_frequency(freq)
-    #         #or write function to make sure a measurement was taken with current parameters befor reciving it.
-    #         sweepResults = lcr._get_measurements()
-    #         sweepResults[frequency_column_header] = freq # add frequency key
-    #         writer.writerow(sweepResults) #store
-    #
-    #     #close file?
-
     # def find_capacitance(self, frequency, ): pass
     # def find_inductance(self): pass
     # def find_inductance(self): pass
     # def find_resistance(self): pass
     # def find_impediance(self): pass
+
+
+
+#useful utility function/s
+def log_frequency_sweep(lcr, path, min_freq, max_freq, steps, parameters,
+                        style = 'log', format = None, metadata = None,
+                        chunk = 64, **kwargs):
+    # sweep straight into an on-disk log (see sinks.py), format from the
+    # extension of path unless given. readings are written every chunk
+    # points so a long sweep can be watched while it runs. kwargs go to
+    # the sink (eg compression, comments)
+    from .sinks import open_sink, session_metadata
+
+    sweepPoints = lcr._generate_sweep_points(min_freq, max_freq, steps, style)
+    lcr._set_measurements(parameters)
+    meta = session_metadata(lcr, sweep_style = style, min_freq = min_freq,
+                            max_freq = max_freq, steps = steps)
+    meta.update(metadata or {})
+
+    with open_sink(path, metadata = meta, format = format, **kwargs) as sink:
+        for i in range(0, len(sweepPoints), chunk):
+            sink.write(lcr._frequency_sweep_array(sweepPoints[i:i + chunk]))
+            sink.flush()
+    return path
+
+
+def csv_frequency_sweep(lcr, filepath, min_freq, max_freq,
+                        steps, parameters, style = 'log'):
+    # creates csv file of parameters over frequency
+    # style - 'log' or 'linear', see SweepStyle
+    # steps = number of descrete steps
+
+    # example
+    # csv_frequency_sweep(lcr, 'lcrCSVtest.csv', 100, 1000, 100,['IMPEDANCE'])
+    return log_frequency_sweep(lcr, filepath, min_freq, max_freq, steps,
+                               parameters, style, format = 'csv',
+                               comments = False)
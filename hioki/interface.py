@@ -0,0 +1,122 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# raw TCP socket interface for python-ivi. the IM3536 LAN port (and
+# simulator.py) speak plain SCPI over a socket, which none of the stock
+# python-ivi interfaces cover without pyvisa.
+#
+#   lcr = hiokiIM3536(SocketInstrument('192.168.1.10', 3500))
+import socket
+
+
+class SocketInstrument(object):
+    "Raw socket instrument interface"
+
+    def __init__(self, host, port = 3500, timeout = 10):
+        self.host = host
+        self.port = port
+        self.term_char = '\r'
+        self.timeout = timeout
+        self._rx = b''
+        self.socket = socket.create_connection((host, port), timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+    def close(self):
+        self.socket.close()
+
+
+    def write_raw(self, data):
+        "Write binary data to instrument"
+        if self.term_char is not None:
+            data += str(self.term_char).encode('utf-8')[0:1]
+        self.socket.sendall(data)
+
+
+    def read_raw(self, num=-1):
+        "Read binary data from instrument"
+        term_char = str(self.term_char).encode('utf-8')[0:1]
+        while True:
+            index = self._rx.find(term_char)
+            if index >= 0:
+                data, self._rx = self._rx[:index + 1], self._rx[index + 1:]
+                return data
+            if 0 < num <= len(self._rx):
+                data, self._rx = self._rx[:num], self._rx[num:]
+                return data
+            chunk = self.socket.recv(65536)
+            if not chunk:
+                raise IOError('connection closed')
+            self._rx += chunk
+
+
+    def ask_raw(self, data, num=-1):
+        "Write then read binary data"
+        self.write_raw(data)
+        return self.read_raw(num)
+
+
+    def write(self, message, encoding = 'utf-8'):
+        "Write string to instrument"
+        if type(message) is tuple or type(message) is list:
+            # recursive call for a list of commands
+            for message_i in message:
+                self.write(message_i, encoding)
+            return
+
+        self.write_raw(str(message).encode(encoding))
+
+
+    def read(self, num=-1, encoding = 'utf-8'):
+        "Read string from instrument"
+        return self.read_raw(num).decode(encoding).rstrip('\r\n')
+
+
+    def ask(self, message, num=-1, encoding = 'utf-8'):
+        "Write then read string"
+        if type(message) is tuple or type(message) is list:
+            # recursive call for a list of commands
+            val = list()
+            for message_i in message:
+                val.append(self.ask(message_i, num, encoding))
+            return val
+
+        self.write(message, encoding)
+        return self.read(num, encoding)
+
+
+    def read_stb(self):
+        "Read status byte"
+        raise NotImplementedError()
+
+
+    def trigger(self):
+        "Send trigger command"
+        self.write("*TRG")
+
+
+    def clear(self):
+        "Send clear command"
+        self.write("*CLS")
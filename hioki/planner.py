@@ -0,0 +1,225 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# execution order for frequency x signal level x DC bias sweeps.
+# points are run in whatever order costs the least settling, range and
+# level switching, and the readings are put back into the logical grid
+# (bias, level, frequency) afterwards, so callers index results the same
+# way whatever order the meter saw.
+#
+#   plan = SweepPlan(freqs, levels=[0.1, 0.5, 1.0], biases=[0, 5, 10])
+#   grid = lcr._run_sweep_plan(plan, ['EQUIVALENT_SERIES_CAPACITANCE'])
+#   grid['EQUIVALENT_SERIES_CAPACITANCE'][bias_i, level_i, freq_i]
+import numpy as np
+
+# logical axis order of plans and their result grids
+SweepAxes = ['BIAS', 'LEVEL', 'FREQUENCY']
+
+SweepMethods = set(['auto', 'nested', 'serpentine', 'greedy'])
+
+
+class TransitionCost(object):
+    "Estimated seconds lost moving between two sweep points"
+
+    def __init__(self, bias = 0.5, bias_per_volt = 0.05, level = 0.02,
+                 frequency = 0.001, frequency_per_decade = 0.01,
+                 range = 0.05, range_of = None):
+        # bias, level, frequency - fixed cost of changing that setting
+        # bias_per_volt - extra bias settling per volt of change
+        # frequency_per_decade - extra per decade jumped, stands in for
+        #                        autorange hunting when range_of is None
+        # range - cost per range step (RangeMapping numbers) switched
+        # range_of - callable(frequency array) -> expected range numbers,
+        #            eg from an earlier sweep of the same part
+        self.bias = bias
+        self.bias_per_volt = bias_per_volt
+        self.level = level
+        self.frequency = frequency
+        self.frequency_per_decade = frequency_per_decade
+        self.range = range
+        self.range_of = range_of
+
+
+    def __call__(self, points, start, ends, ranges = None):
+        # cost from points[start] to each of points[ends]. points is an
+        # (n, 3) array in SweepAxes order, NaN for an unused axis
+        a = points[start]
+        b = points[ends]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bias = b[:, 0] != a[0]
+            level = b[:, 1] != a[1]
+            freq = b[:, 2] != a[2]
+            cost = (bias * (self.bias + self.bias_per_volt
+                            * np.abs(b[:, 0] - a[0]))
+                    + level * self.level
+                    + freq * (self.frequency + self.frequency_per_decade
+                              * np.abs(np.log10(b[:, 2] / a[2]))))
+            if ranges is not None:
+                cost = cost + self.range * np.abs(ranges[ends] - ranges[start])
+        return np.nan_to_num(cost)
+
+
+def serpentine(sizes):
+    # reflected mixed radix gray code over an index grid of sizes, outer
+    # axis first. consecutive tuples differ by one step on one axis.
+    count = int(np.prod(sizes))
+    idx = [0] * len(sizes)
+    direction = [1] * len(sizes)
+    order = [tuple(idx)]
+    for i in range(count - 1):
+        for k in reversed(range(len(sizes))):
+            step = idx[k] + direction[k]
+            if 0 <= step < sizes[k]:
+                idx[k] = step
+                break
+            direction[k] = -direction[k]
+        order.append(tuple(idx))
+    return order
+
+
+class SweepPlan(object):
+    "Grid of sweep points and the order to measure them in"
+
+    def __init__(self, frequencies, levels = None, biases = None,
+                 cost = None, method = 'auto', greedy_limit = 4000):
+        # levels - signal levels for the current signal mode (CV/CC)
+        # biases - DC bias voltages
+        # None leaves that setting alone, its axis has length 1
+        # method - nested:     plain bias/level/frequency loops
+        #          serpentine: most expensive axis outermost, inner axes
+        #                      reversing so only one setting changes a step
+        #          greedy:     cheapest next point from the cost model
+        #          auto:       the cheapest of serpentine and greedy
+        # greedy is O(n^2) and skipped by auto above greedy_limit points
+        if method not in SweepMethods:
+            raise ValueError(method)
+        self.axes = [np.asarray([np.nan] if values is None else values,
+                                dtype=np.float64)
+                     for values in (biases, levels, frequencies)]
+        self.shape = tuple(len(values) for values in self.axes)
+        self.cost = cost if cost is not None else TransitionCost()
+
+        grids = np.meshgrid(*self.axes, indexing='ij')
+        self.points = np.stack([grid.ravel() for grid in grids], axis=1)
+        self.ranges = None
+        if self.cost.range_of is not None:
+            self.ranges = np.asarray(self.cost.range_of(self.points[:, 2]),
+                                     dtype=np.float64)
+
+        self.naive_cost = self.order_cost(np.arange(len(self.points)))
+
+        candidates = []
+        if method == 'nested':
+            candidates.append(np.arange(len(self.points)))
+        if method in ('serpentine', 'auto'):
+            candidates.append(self._serpentine())
+        if method == 'greedy' or (method == 'auto'
+                                  and len(self.points) <= greedy_limit):
+            candidates.append(self._greedy(candidates[0][0]
+                                           if candidates else 0))
+        costs = [self.order_cost(order) for order in candidates]
+        best = int(np.argmin(costs))
+        self.order = candidates[best]
+        self.estimated_cost = costs[best]
+
+
+    def __len__(self):
+        return len(self.points)
+
+
+    def order_cost(self, order):
+        # estimated seconds of transitions running points in order
+        total = 0.0
+        for (start, end) in zip(order[:-1], order[1:]):
+            total += self.cost(self.points, start, [end], self.ranges)[0]
+        return total
+
+
+    def _axis_cost(self, axis):
+        # typical cost of one step along axis, to rank the axes
+        if self.shape[axis] < 2:
+            return 0.0
+        step = [0, 0, 0]
+        step[axis] = 1
+        ends = np.ravel_multi_index(step, self.shape)
+        return self.cost(self.points, 0, [ends], self.ranges)[0]
+
+
+    def _serpentine(self):
+        nest = sorted(range(3), key=self._axis_cost, reverse=True)
+        sizes = [self.shape[axis] for axis in nest]
+        order = []
+        for idx in serpentine(sizes):
+            logical = [0, 0, 0]
+            for (axis, i) in zip(nest, idx):
+                logical[axis] = i
+            order.append(np.ravel_multi_index(logical, self.shape))
+        return np.asarray(order)
+
+
+    def _greedy(self, start):
+        count = len(self.points)
+        remaining = np.ones(count, dtype=bool)
+        indices = np.arange(count)
+        order = [start]
+        remaining[start] = False
+        current = start
+        for i in range(count - 1):
+            candidates = indices[remaining]
+            cost = self.cost(self.points, current, candidates, self.ranges)
+            current = candidates[int(np.argmin(cost))]
+            remaining[current] = False
+            order.append(current)
+        return np.asarray(order)
+
+
+    def steps(self):
+        # (logical index, bias, level, frequency) in execution order,
+        # None for a setting that doesn't change from the previous step
+        # (always given for the first)
+        previous = None
+        for index in self.order:
+            point = self.points[index]
+            step = []
+            for axis in range(3):
+                value = point[axis]
+                if np.isnan(value) or (previous is not None
+                                       and previous[axis] == value):
+                    step.append(None)
+                else:
+                    step.append(float(value))
+            previous = point
+            yield (int(index), step[0], step[1], step[2])
+
+
+    def assemble(self, records, indices):
+        # records - structured array of readings in execution order
+        # indices - logical index of each record
+        # returns a structured array of self.shape in logical grid order,
+        # points that weren't measured are NaN
+        grid = np.zeros(len(self.points), dtype=records.dtype)
+        grid.view(np.float64)[:] = np.nan
+        grid[np.asarray(indices, dtype=np.intp)] = records
+        return grid.reshape(self.shape)
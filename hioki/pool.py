@@ -0,0 +1,170 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# run blocking hiokiIM3536 sessions in parallel. each meter gets its own
+# single worker thread so its commands stay in order, and results from all
+# meters are merged into one time ordered stream.
+#
+#   pool = MeterPool({'rack1': lcr1, 'rack2': lcr2})
+#   for result in pool.stream(lambda lcr: lcr._get_measurements(), count=100):
+#       print(result.timestamp, result.meter, result.value, result.error)
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+
+# one result from one meter. error is the exception if the job failed, in
+# which case value is None
+PoolResult = collections.namedtuple('PoolResult',
+                                    ['timestamp', 'meter', 'value', 'error'])
+
+_Done = object()
+
+
+class MeterPool(object):
+    "Thread pool with one worker per instrument"
+
+    def __init__(self, meters):
+        # meters - dict of name : hiokiIM3536, or a list (named by index)
+        if not isinstance(meters, dict):
+            meters = dict(enumerate(meters))
+        self.meters = meters
+        self._executors = dict(
+            (name, concurrent.futures.ThreadPoolExecutor(max_workers=1))
+            for name in meters)
+        self._lock = threading.Lock()
+
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def submit(self, name, job, *args, **kwargs):
+        # run job(meter, *args, **kwargs) on the meter's worker, returns a
+        # concurrent.futures.Future
+        return self._executors[name].submit(job, self.meters[name],
+                                            *args, **kwargs)
+
+
+    def _run(self, name, job, args, kwargs):
+        try:
+            value = job(self.meters[name], *args, **kwargs)
+            error = None
+        except Exception as e:
+            value = None
+            error = e
+        return PoolResult(time.time(), name, value, error)
+
+
+    def map(self, job, *args, **kwargs):
+        # run job once on every meter in parallel, returns dict of
+        # name : PoolResult. a failing meter doesn't affect the others
+        futures = dict((name, executor.submit(self._run, name, job,
+                                              args, kwargs))
+                       for (name, executor) in self._executors.items())
+        return dict((name, future.result())
+                    for (name, future) in futures.items())
+
+
+    def measure_all(self):
+        return self.map(lambda lcr: lcr._get_measurements())
+
+
+    def _merge(self, producer):
+        # run producer(name, emit) on every meter and yield what they emit
+        # in time order. emit stamps and queues results under one lock so
+        # the queue order is the timestamp order.
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def emit(name, value, error = None):
+            with self._lock:
+                results.put(PoolResult(time.time(), name, value, error))
+            return not stop.is_set()
+
+        def worker(name):
+            try:
+                producer(name, emit)
+            except Exception as e:
+                emit(name, None, e)
+            finally:
+                results.put(_Done)
+
+        for (name, executor) in self._executors.items():
+            executor.submit(worker, name)
+
+        running = len(self._executors)
+        try:
+            while running:
+                result = results.get()
+                if result is _Done:
+                    running -= 1
+                    continue
+                yield result
+        finally:
+            # consumer gave up early, let the workers wind down
+            stop.set()
+
+
+    def stream(self, job, count = None, interval = 0):
+        # call job(meter) repeatedly on every meter, yielding PoolResults in
+        # time order. count - calls per meter, None = until the generator is
+        # closed. a meter whose job raises yields the error and stops, the
+        # other meters carry on.
+        def producer(name, emit):
+            meter = self.meters[name]
+            done = 0
+            while count is None or done < count:
+                if not emit(name, job(meter)):
+                    return
+                done += 1
+                if interval:
+                    time.sleep(interval)
+
+        return self._merge(producer)
+
+
+    def sweep(self, frequencies, parameters = None):
+        # frequency sweep on every meter in parallel. values are
+        # (frequency, measurement dict) as from _frequency_sweep
+        frequencies = list(frequencies)
+
+        def producer(name, emit):
+            for point in self.meters[name]._frequency_sweep(frequencies,
+                                                            parameters):
+                if not emit(name, point):
+                    return
+
+        return self._merge(producer)
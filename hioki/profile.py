@@ -0,0 +1,198 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# declarative measurement setups ("recipes") that can be applied to a
+# hiokiIM3536, writing only the settings that differ from its cached state
+import collections
+import json
+
+from .hiokiIM3536 import ParameterBitMapping
+
+# profile field : (cache tag, driver attribute, driver setter, value type)
+# listed in the order they are applied, modes before their levels
+ProfileFieldMapping = collections.OrderedDict([
+        ('measurement_frequency', ('measurement_frequency',
+                                   '_measurement_frequency',
+                                   '_set_measurement_frequency', float)),
+        ('meas_sig_mode', ('meas_sig_mode', '_meas_sig_mode',
+                           '_set_meas_sig_mode', str)),
+        ('meas_sig_cv', ('meas_sig_cv', '_meas_sig_cv',
+                         '_set_meas_sig_cv', float)),
+        ('meas_sig_cc', ('meas_sig_cc', '_meas_sig_cc',
+                         '_set_meas_sig_cc', float)),
+        ('meas_limit_mode', ('meas_limit_mode', '_meas_limit_mode',
+                             '_set_meas_limit_mode', str)),
+        ('meas_limit_v', ('meas_limit_v', '_meas_limit_v',
+                          '_set_meas_limit_v', float)),
+        ('meas_limit_c', ('meas_limit_c', '_meas_limit_c',
+                          '_set_meas_limit_c', float)),
+        ('aquire_speed', ('aquire_speed', '_aquire_speed',
+                          '_set_aquire_speed', str)),
+        ('averaging_setting', ('averaging_setting', '_averaging_setting',
+                               '_set_averaging_setting', int)),
+        ('autorange', ('autorange', '_autorange', '_set_autorange', str)),
+        ('range', ('range', '_range', '_set_range', int)),
+        ('dc_bias_en', ('dc_bias_en', '_dc_bias_en', '_set_dc_bias_en', str)),
+        ('dc_bias', ('dc_bias', '_dc_bias', '_set_dc_bias', float)),
+        ])
+
+ProfileFields = list(ProfileFieldMapping) + ['measurement_items']
+
+
+def _normalize(field, value):
+    # bring profile and cached values to the same form for comparison
+    if value is None:
+        return None
+    if field == 'measurement_items':
+        # the order the meter returns them in, so the same set of items is
+        # the same profile however it was listed
+        for item in value:
+            if item not in ParameterBitMapping:
+                raise ValueError('unknown measurement item %s' % item)
+        return tuple(sorted(set(value), key=lambda item:
+                            ParameterBitMapping[item][0]
+                            + ParameterBitMapping[item][1] * 8))
+    if field == 'dc_bias_en' and (value is True or value is False):
+        return 'ON' if value else 'OFF'
+    if field == 'averaging_setting':
+        # same form _set_averaging_setting stores, 'OFF' or the count
+        if value is False or str(value).upper() == 'OFF':
+            return 'OFF'
+        return int(value)
+    value_type = ProfileFieldMapping[field][3]
+    if value_type is str:
+        return str(value).upper()
+    return value_type(value)
+
+
+class MeasurementProfile(collections.namedtuple('MeasurementProfile',
+                                                ProfileFields)):
+    "Hashable measurement setup, None fields are left untouched"
+    __slots__ = ()
+
+    def __new__(cls, **kwargs):
+        values = []
+        for field in ProfileFields:
+            values.append(_normalize(field, kwargs.pop(field, None)))
+        if kwargs:
+            raise TypeError('unknown profile fields: %s'
+                            % ', '.join(sorted(kwargs)))
+        return super(MeasurementProfile, cls).__new__(cls, *values)
+
+
+    def to_dict(self):
+        # only the fields that are set
+        d = {}
+        for (field, value) in zip(self._fields, self):
+            if value is not None:
+                d[field] = list(value) if field == 'measurement_items' else value
+        return d
+
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+
+    @classmethod
+    def from_json(cls, s):
+        return cls.from_dict(json.loads(s))
+
+
+    def replace(self, **kwargs):
+        # copy with some fields changed
+        d = self.to_dict()
+        d.update(kwargs)
+        return MeasurementProfile(**d)
+
+
+    def apply(self, lcr):
+        return lcr._apply_profile(self)
+
+
+def get_profile(lcr):
+    # profile of everything the driver has a valid cached value for
+    d = {}
+    for (field, (tag, attr, setter, value_type)) in ProfileFieldMapping.items():
+        if lcr._get_cache_valid(tag) and hasattr(lcr, attr):
+            d[field] = getattr(lcr, attr)
+    if lcr._measurement_item_order_cache is not None \
+            and lcr._derived_items is None \
+            and getattr(lcr, '_current_meas_items', None) is not None:
+        d['measurement_items'] = lcr._current_meas_items
+    return MeasurementProfile(**d)
+
+
+def apply_profile(lcr, profile):
+    changed = []
+    current = get_profile(lcr)
+
+    with lcr.batch():
+        for (field, (tag, attr, setter, value_type)) \
+                in ProfileFieldMapping.items():
+            value = getattr(profile, field)
+            if value is None or getattr(current, field) == value:
+                continue
+            if field == 'range' and profile.autorange == 'ON':
+                # setting a range would turn autorange back off
+                continue
+            getattr(lcr, setter)(value)
+            changed.append(field)
+
+        items = profile.measurement_items
+        if items is not None and current.measurement_items != items:
+            lcr._set_measurements(list(items))
+            changed.append('measurement_items')
+
+    return changed
+
+
+def invalidate_profile_cache(lcr):
+    # forget every setting a profile covers, leaving identity and other
+    # cached attributes alone
+    for (tag, attr, setter, value_type) in ProfileFieldMapping.values():
+        lcr._set_cache_valid(False, tag)
+    lcr._measurement_item_order_cache = None
+    lcr._derived_items = None
+
+
+def restore_profile_cache(lcr, profile):
+    # mark the instrument as being in the state described by profile without
+    # sending anything, eg after recalling a panel saved from that state
+    invalidate_profile_cache(lcr)
+    for (field, (tag, attr, setter, value_type)) in ProfileFieldMapping.items():
+        value = getattr(profile, field)
+        if value is not None:
+            setattr(lcr, attr, value)
+            lcr._set_cache_valid(True, tag)
+    if profile.measurement_items is not None:
+        items = list(profile.measurement_items)
+        lcr._current_meas_items = items
+        lcr._measurement_item_order_cache = \
+            [item for item in lcr.sortedParameterBitMappingKeys if item in items]
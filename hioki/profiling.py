@@ -0,0 +1,211 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# opt-in I/O instrumentation. with a profiler attached every message the
+# driver sends or queries is timed (wall and thread cpu) and counted per
+# command, and every reading gets a wait/query/parse breakdown. without
+# one the driver only pays an `is None` check per call.
+#
+#   profiler = lcr._enable_profiling()
+#   ... sweep ...
+#   profiler.summary()['commands'][':MEAS?']['wall']['p99']
+#   profiler.export('io-profile.json')
+import json
+import math
+import threading
+
+ReadingPhases = ['wait', 'query', 'parse', 'total']
+
+# distinct messages whose histogram key is remembered, so repeated
+# commands skip parsing their header
+KeyCacheSize = 4096
+
+_log10 = math.log10
+
+
+class LatencyHistogram(object):
+    "Log spaced latency histogram, 1us to 100s at 10 bins per decade"
+
+    BinsPerDecade = 10
+    MinExponent = -6
+    Bins = 8 * BinsPerDecade
+
+    def __init__(self):
+        self.counts = [0] * (self.Bins + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds <= 0:
+            self.counts[0] += 1
+            return
+        index = int((_log10(seconds) - self.MinExponent) * self.BinsPerDecade)
+        self.counts[min(max(index, 0), self.Bins)] += 1
+
+
+    def _upper(self, index):
+        return 10 ** (self.MinExponent + float(index + 1) / self.BinsPerDecade)
+
+
+    def percentile(self, p):
+        # upper edge of the bin holding the p'th percentile, capped at max
+        if not self.count:
+            return None
+        target = p / 100.0 * self.count
+        seen = 0
+        for (index, count) in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(self._upper(index), self.max)
+        return self.max
+
+
+    def to_dict(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            }
+
+
+class CommandStats(object):
+    "Counters of one command header"
+
+    def __init__(self):
+        self.wall = LatencyHistogram()
+        self.cpu = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+
+    def to_dict(self):
+        return {
+            'wall': self.wall.to_dict(),
+            'cpu': self.cpu,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            }
+
+
+def command_key(kind, data):
+    # histogram key of a message: its first header, '?' kept for queries.
+    # batched messages are keyed by their first command plus a count
+    if not isinstance(data, str):
+        return '<raw %s>' % kind
+    head = data.split(None, 1)[0] if data.strip() else data
+    count = data.count(';')
+    if count:
+        head = head.split(';', 1)[0]
+        return '%s (+%d)' % (head, count)
+    return head
+
+
+class IOProfiler(object):
+    "Per command latency histograms and per reading phase breakdown"
+
+    def __init__(self, callback = None, reading_callback = None):
+        # callback(kind, command, bytes_out, bytes_in, wall, cpu) after
+        #   every write ('write') or query ('ask')
+        # reading_callback(phases) with a dict of ReadingPhases seconds
+        #   after every reading
+        self.callback = callback
+        self.reading_callback = reading_callback
+        self._lock = threading.Lock()
+        self._keys = {}
+        self.reset()
+
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+            self.phases = dict((phase, LatencyHistogram())
+                               for phase in ReadingPhases)
+
+
+    def record(self, kind, data, bytes_in, wall, cpu):
+        key = self._keys.get(data)
+        if key is None:
+            key = command_key(kind, data)
+            if len(self._keys) < KeyCacheSize:
+                self._keys[data] = key
+        bytes_out = len(data)
+        with self._lock:
+            stats = self.commands.get(key)
+            if stats is None:
+                stats = self.commands[key] = CommandStats()
+            stats.wall.add(wall)
+            stats.cpu += cpu
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+        if self.callback is not None:
+            self.callback(kind, key, bytes_out, bytes_in, wall, cpu)
+
+
+    def record_reading(self, start, waited, queried, parsed):
+        # perf_counter marks around one reading
+        phases = self.phases
+        with self._lock:
+            phases['wait'].add(waited - start)
+            phases['query'].add(queried - waited)
+            phases['parse'].add(parsed - queried)
+            phases['total'].add(parsed - start)
+        if self.reading_callback is not None:
+            self.reading_callback({
+                'wait': waited - start,
+                'query': queried - waited,
+                'parse': parsed - queried,
+                'total': parsed - start,
+                })
+
+
+    def summary(self):
+        with self._lock:
+            return {
+                'commands': dict((key, stats.to_dict())
+                                 for (key, stats) in self.commands.items()),
+                'readings': dict((phase, hist.to_dict())
+                                 for (phase, hist) in self.phases.items()),
+                }
+
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=1, sort_keys=True)
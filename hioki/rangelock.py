@@ -0,0 +1,123 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# learned range lock. autorange hunts for a range at every new frequency,
+# a RangeTable remembers the range the meter settled on per frequency for
+# one fixture/part type so later sweeps can select it directly. see
+# hiokiIM3536._set_range_lock
+#
+#   cache = RangeCache('~/.cache/im3536-ranges.json')
+#   table = cache.load('0805-1uF') or lcr._learn_ranges(freqs, '0805-1uF')
+#   lcr._set_range_lock(table)
+#   buf = lcr._frequency_sweep_array(freqs)
+#   cache.save(table)      # keeps anything relearned after an overflow
+import bisect
+
+from .statecache import StateCache
+
+
+class RangeTable(object):
+    "Range number (RangeMapping value) per frequency"
+
+    def __init__(self, key, ranges = None):
+        # ranges - dict of frequency : range number
+        self.key = key
+        self._freqs = []
+        self._ranges = []
+        self.dirty = False
+        for (freq, num) in sorted((ranges or {}).items()):
+            self.record(freq, num)
+        self.dirty = False
+
+
+    def __len__(self):
+        return len(self._freqs)
+
+
+    def record(self, frequency, num):
+        frequency = round(float(frequency), 3)
+        i = bisect.bisect_left(self._freqs, frequency)
+        if i < len(self._freqs) and self._freqs[i] == frequency:
+            if self._ranges[i] == num:
+                return
+            self._ranges[i] = int(num)
+        else:
+            self._freqs.insert(i, frequency)
+            self._ranges.insert(i, int(num))
+        self.dirty = True
+
+
+    def lookup(self, frequency, max_ratio = 10.0):
+        # range at frequency, or None when unknown. frequencies between
+        # two learned points get their range if both agree and neither is
+        # more than max_ratio away.
+        frequency = round(float(frequency), 3)
+        i = bisect.bisect_left(self._freqs, frequency)
+        if i < len(self._freqs) and self._freqs[i] == frequency:
+            return self._ranges[i]
+        if i == 0 or i == len(self._freqs):
+            return None
+        (low, high) = (self._freqs[i - 1], self._freqs[i])
+        if self._ranges[i - 1] != self._ranges[i] \
+                or frequency / low > max_ratio or high / frequency > max_ratio:
+            return None
+        return self._ranges[i]
+
+
+    def items(self):
+        return list(zip(self._freqs, self._ranges))
+
+
+    def to_dict(self):
+        # json keys must be strings
+        return {'ranges': [[freq, num] for (freq, num) in self.items()]}
+
+
+    @classmethod
+    def from_dict(cls, key, d):
+        return cls(key, dict((freq, num) for (freq, num) in d['ranges']))
+
+
+class RangeCache(object):
+    "RangeTables kept in a StateCache style json file, one per key"
+
+    def __init__(self, path):
+        self._cache = StateCache(path)
+
+
+    def load(self, key):
+        d = self._cache.load(key)
+        if d is None:
+            return None
+        return RangeTable.from_dict(key, d)
+
+
+    def save(self, table):
+        self._cache.save(table.key, table.to_dict())
+        table.dirty = False
+
+
+    def invalidate(self, key):
+        self._cache.invalidate(key)
@@ -0,0 +1,82 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# settle detection by convergence of successive readings, used after DC
+# bias changes instead of a fixed worst case sleep.
+#
+#   settle = SettleDetector(tolerance=1e-3, window=3, max_wait=5)
+#   cv = lcr._bias_sweep(np.linspace(0, 25, 51), settle=settle)
+import collections
+
+
+class SettleDetector(object):
+    "Decides when successive readings of one item have stopped moving"
+
+    def __init__(self, tolerance = 1e-3, window = 3, absolute = 0.0,
+                 interval = 0.0, min_wait = 0.0, max_wait = 10.0,
+                 item = None):
+        # settled once the last window readings lie within tolerance
+        # (relative to their mean) or absolute of each other, and at least
+        # min_wait seconds have passed. max_wait gives up.
+        # interval - seconds between readings. readings taken much faster
+        #            than the part settles look converged early, spread the
+        #            window over roughly the settling time constant.
+        # item - ParameterBitMapping key to watch. None picks a capacitance
+        #        if measured, else IMPEDANCE, else the first item.
+        if window < 2:
+            raise ValueError('window must be at least 2 readings')
+        self.tolerance = tolerance
+        self.window = int(window)
+        self.absolute = absolute
+        self.interval = interval
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.item = item
+        self._values = collections.deque(maxlen=self.window)
+
+
+    def reset(self):
+        self._values.clear()
+
+
+    def pick_item(self, fields):
+        if self.item is not None:
+            return self.item
+        for item in ('EQUIVALENT_SERIES_CAPACITANCE',
+                     'EQUIVALENT_PARALLEL_CAPACITANCE', 'IMPEDANCE'):
+            if item in fields:
+                return item
+        return fields[0]
+
+
+    def add(self, value):
+        # True once the readings so far have converged
+        values = self._values
+        values.append(value)
+        if len(values) < self.window:
+            return False
+        spread = max(values) - min(values)
+        mean = abs(sum(values) / len(values))
+        return spread <= self.absolute or spread <= self.tolerance * mean
@@ -0,0 +1,721 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# simulated IM3536 for benchmarking and testing without a meter.
+# speaks the SCPI subset the driver uses, '\r' terminated, over TCP or a pty.
+# impedance comes from a configurable RLC model, latency can be injected.
+#
+#   python -m hioki.simulator --port 3500 --model series --r 10 --c 1e-6
+#   lcr = hiokiIM3536(SocketInstrument('localhost', 3500))
+# or
+#   python -m hioki.simulator --pty
+#   lcr = hiokiIM3536('ASRL::/dev/pts/5,9600::INSTR')
+import argparse
+import cmath
+import copy
+import math
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+import tty
+
+from .hiokiIM3536 import ParameterBitMapping, ESR0_BitMapping, \
+    MemoryCapacity, PanelCount, RangeMapping
+
+# seconds per measurement at each speed, before the signal period and
+# averaging are added. roughly the IM3536 datasheet figures.
+SpeedMeasurementTime = {
+        'FAST': 0.0015,
+        'MED': 0.004,
+        'SLOW': 0.04,
+        'SLOW2': 0.1,
+        }
+
+# noise relative to MED at each speed, longer integration averages more
+SpeedNoiseFactor = {
+        'FAST': 2.0,
+        'MED': 1.0,
+        'SLOW': 0.35,
+        'SLOW2': 0.2,
+        }
+
+# full scale impedance of each range number
+RangeFullScale = dict((num, 0.1 * 10 ** (num - 1))
+                      for num in RangeMapping.values())
+
+
+class SeriesRLC(object):
+    "R, L and C in series, None leaves a component out"
+
+    def __init__(self, r = 0.0, l = None, c = None):
+        self.r = r
+        self.l = l
+        self.c = c
+
+    def impedance(self, frequency, bias = 0.0):
+        w = 2 * math.pi * frequency
+        z = complex(self.r or 0.0, 0)
+        if self.l:
+            z += 1j * w * self.l
+        if self.c:
+            z += 1 / (1j * w * self.c)
+        return z
+
+
+class ParallelRLC(object):
+    "R, L and C in parallel, None leaves a component out"
+
+    def __init__(self, r = None, l = None, c = None):
+        self.r = r
+        self.l = l
+        self.c = c
+
+    def impedance(self, frequency, bias = 0.0):
+        w = 2 * math.pi * frequency
+        y = 0j
+        if self.r:
+            y += 1 / self.r
+        if self.l:
+            y += 1 / (1j * w * self.l)
+        if self.c:
+            y += 1j * w * self.c
+        return 1 / y if y else complex(1e12, 0)
+
+
+class BiasedCapacitor(object):
+    "MLCC-like capacitor whose capacitance falls with DC bias"
+
+    def __init__(self, c = 1e-6, esr = 0.01, v_half = 10.0):
+        self.c = c
+        self.esr = esr
+        self.v_half = v_half
+
+    def impedance(self, frequency, bias = 0.0):
+        c = self.c / (1 + (bias / self.v_half) ** 2)
+        return complex(self.esr, 0) + 1 / (2j * math.pi * frequency * c)
+
+
+ModelMapping = {
+        'series': SeriesRLC,
+        'parallel': ParallelRLC,
+        'mlcc': BiasedCapacitor,
+        }
+
+
+def short_form(node):
+    # SCPI short form of one header node, keeping any numeric suffix.
+    # FREQUENCY -> FREQ, DCBIAS -> DCB, ESR0 -> ESR0
+    suffix = ''
+    while node and node[-1].isdigit():
+        suffix = node[-1] + suffix
+        node = node[:-1]
+    if len(node) > 4:
+        node = node[:3] if node[3] in 'AEIOU' else node[:4]
+    return node + suffix
+
+
+def parameter_values(z, frequency):
+    # every ParameterBitMapping item for complex impedance z
+    w = 2 * math.pi * frequency
+    r, x = z.real, z.imag
+    mag = abs(z) or 1e-30
+    y = 1 / z if z else complex(1e30, 0)
+    g, b = y.real, y.imag
+
+    def div(a, d):
+        return a / d if d else float('inf')
+
+    return {
+        'IMPEDANCE': mag,
+        'ADMITTANCE': abs(y),
+        'IMPEDANCE_PHASE_ANGLE': math.degrees(cmath.phase(z)),
+        'EQUIVALENT_SERIES_CAPACITANCE': div(-1.0, w * x),
+        'EQUIVALENT_PARALLEL_CAPACITANCE': b / w,
+        'LOSS_FACTOR': abs(div(r, x)),
+        'EQUIVALENT_SERIES_INDUCTANCE': x / w,
+        'EQUIVALENT_PARALLEL_INDUCTANCE': div(-1.0, w * b),
+        'Q_FACTOR': abs(div(x, r)),
+        'EQUIVALENT_SERIES_RESISTANCE': r,
+        'EQUIVALENT_PARALLEL_RESISTANCE': div(1.0, g),
+        'CONDUCTANCE': g,
+        'REACTANCE': x,
+        'SUBSEPTANCE': b,
+        'DC_RESISTANCE': r,
+        'CONDUCTIVITY': 0.0,
+        'PERMITTIVITY': 0.0,
+        }
+
+
+class SimulatedIM3536(object):
+    "Command level model of an IM3536"
+
+    def __init__(self, model = None, latency = 0.0, noise = 0.0,
+                 serial = 'SIM000001', realtime = True, bias_tau = 0.0):
+        # model - object with impedance(frequency, bias), see ModelMapping
+        # latency - seconds added to every received message
+        # noise - relative gaussian noise on |Z| at MED, no averaging and
+        #         high frequency. scaled by SpeedNoiseFactor, averaging and
+        #         rising below 100Hz
+        # realtime - measurements take SpeedMeasurementTime of wall time
+        # bias_tau - time constant the part takes to settle after a DC
+        #            bias change, seconds
+        self.model = model if model is not None else SeriesRLC(10.0, None, 1e-6)
+        self.latency = latency
+        self.noise = noise
+        self.bias_tau = bias_tau
+        self.serial = serial
+        self.realtime = realtime
+        self.lock = threading.Lock()
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages = 0
+        self.commands = 0
+
+        self.panels = {}
+        self.reset()
+
+
+    def reset(self):
+        self.settings = {
+            'MODE': 'LCR',
+            'FREQ': 1000.0,
+            'RANG': 4,
+            'RANG:AUTO': 'ON',
+            'SPEE': 'MED',
+            'AVER': 'OFF',
+            'LEV': 'V',
+            'LEV:VOLT': 1.0,
+            'LEV:CVOL': 1.0,
+            'LEV:CCUR': 0.01,
+            'LIM': 'OFF',
+            'LIM:VOLT': 5.0,
+            'LIM:CURR': 0.1,
+            'DCB': 'OFF',
+            'DCB:LEV': 0.0,
+            'TRIG': 'INT',
+            'MEAS:ITEM': [0, 0, 0],
+            'CORR:OPEN': 'OFF',
+            'CORR:SHOR': 'OFF',
+            'CORR:CABL': 0,
+            'COMP': 'OFF',
+            'BIN': 'OFF',
+            'MEAS:VAL': 1,
+            'BEEP:JUDG': 'OFF',
+            }
+        # (mode, reference, low, high) of the comparator and each bin
+        self.comparator = None
+        self.bins = {}
+        self.esr = 0
+        self.esr_regs = [0, 0, 0, 0]
+        self.ese_regs = [0, 0, 0, 0]
+        self.sre = 0
+        self.memory = []
+        self.memory_on = False
+        self._bias_from = 0.0
+        self._bias_time = 0.0
+        self._restart()
+
+
+    def _restart(self):
+        # settings changed, measurement cycle starts over
+        self._cycle_start = time.time()
+        self._cycles_seen = 0
+        self._memory_cycles = 0
+
+
+    def measurement_time(self):
+        freq = self.settings['FREQ']
+        aver = self.settings['AVER']
+        count = 1 if aver == 'OFF' else int(aver)
+        return (SpeedMeasurementTime[self.settings['SPEE']] + 1.0 / freq) * count
+
+
+    def _completed_cycles(self):
+        if not self.realtime:
+            return self._cycles_seen + 1
+        return int((time.time() - self._cycle_start) / self.measurement_time())
+
+
+    def _update(self):
+        # advance the free running measurement, latching EOM and filling
+        # memory as the real meter would
+        if self.settings['TRIG'] != 'INT':
+            return
+        cycles = self._completed_cycles()
+        if cycles > self._cycles_seen:
+            self._cycles_seen = cycles
+            self.esr_regs[0] |= 0x01 << ESR0_BitMapping['EOM']
+        if self.memory_on:
+            while self._memory_cycles < cycles \
+                    and len(self.memory) < MemoryCapacity:
+                self.memory.append(self._measure())
+                self._memory_cycles += 1
+            self._memory_cycles = cycles
+
+
+    def _bias(self):
+        # DC bias the part currently sees, relaxing towards the set level
+        target = self.settings['DCB:LEV'] if self.settings['DCB'] == 'ON' \
+            else 0.0
+        if not self.bias_tau:
+            return target
+        dt = time.time() - self._bias_time
+        return target + (self._bias_from - target) * math.exp(-dt / self.bias_tau)
+
+
+    def _measure(self):
+        freq = self.settings['FREQ']
+        z = self.model.impedance(freq, self._bias())
+        if self.noise:
+            aver = self.settings['AVER']
+            count = 1 if aver == 'OFF' else int(aver)
+            sigma = (self.noise * SpeedNoiseFactor[self.settings['SPEE']]
+                     * math.sqrt((1 + 100.0 / freq) / count))
+            z *= 1 + random.gauss(0, sigma)
+
+        # range handling and the ESR0 flags that go with it
+        mag = abs(z)
+        if self.settings['RANG:AUTO'] == 'ON':
+            for num in sorted(RangeFullScale):
+                if mag <= RangeFullScale[num] * 1.1:
+                    break
+            self.settings['RANG'] = num
+        full_scale = RangeFullScale[self.settings['RANG']]
+        if mag > full_scale * 1.2:
+            self.esr_regs[0] |= 0x01 << ESR0_BitMapping['MOF']
+        elif self.settings['RANG'] > 1 and mag < full_scale / 100:
+            self.esr_regs[0] |= 0x01 << ESR0_BitMapping['MUF']
+
+        values = parameter_values(z, freq)
+        return [values[item] for item in self.measurement_order()]
+
+
+    def measurement_order(self):
+        item_bytes = self.settings['MEAS:ITEM']
+        order = []
+        for item in sorted(ParameterBitMapping,
+                           key=lambda k: ParameterBitMapping[k][0]
+                           + ParameterBitMapping[k][1] * 8):
+            bits = ParameterBitMapping[item]
+            if item_bytes[bits[1]] & (0x01 << bits[0]):
+                order.append(item)
+        if not order:
+            # display parameters when nothing is configured
+            order = ['IMPEDANCE', 'IMPEDANCE_PHASE_ANGLE']
+        return order
+
+
+    def handle(self, message):
+        # one received message (may hold ';' separated commands)
+        # returns the response string, or None if nothing was queried
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.messages += 1
+            self.bytes_in += len(message) + 1
+            responses = []
+            for cmd in message.split(';'):
+                cmd = cmd.strip()
+                if not cmd:
+                    continue
+                self.commands += 1
+                try:
+                    resp = self._command(cmd)
+                except (ValueError, IndexError, KeyError):
+                    self.esr |= 0x20 # command error
+                    resp = None
+                if resp is not None:
+                    responses.append(resp)
+            if not responses:
+                return None
+            resp = ';'.join(responses)
+            self.bytes_out += len(resp) + 1
+            return resp
+
+
+    def _command(self, cmd):
+        parts = cmd.split(None, 1)
+        header = parts[0].upper()
+        args = parts[1].split(',') if len(parts) > 1 else []
+        args = [a.strip() for a in args]
+        query = header.endswith('?')
+        header = header.rstrip('?')
+        if not header.startswith('*'):
+            header = ':'.join(short_form(node)
+                              for node in header.strip(':').split(':'))
+
+        self._update()
+
+        handler = getattr(self, '_cmd_' + header.replace('*', 'STAR_')
+                          .replace(':', '_'), None)
+        if handler is not None:
+            return handler(query, args)
+
+        if header.startswith('ESR') and query:
+            reg = int(header[3:])
+            value, self.esr_regs[reg] = self.esr_regs[reg], 0
+            return '%d' % value
+        if header.startswith('ESE'):
+            reg = int(header[3:])
+            if query:
+                return '%d' % self.ese_regs[reg]
+            self.ese_regs[reg] = int(args[0])
+            return None
+        if header.startswith('PAR') and header[3:].isdigit():
+            return None
+
+        if header in self.settings:
+            if query:
+                return self._format(self.settings[header])
+            self._set(header, args[0])
+            return None
+
+        self.esr |= 0x20 # command error
+        return None
+
+
+    def _format(self, value):
+        if isinstance(value, float):
+            return '%.5E' % value
+        return '%s' % value
+
+
+    def _set(self, header, value):
+        current = self.settings[header]
+        if isinstance(current, float):
+            value = float(value)
+        elif isinstance(current, int) and not isinstance(current, bool):
+            value = int(float(value))
+        else:
+            value = value.upper()
+            if header == 'RANG:AUTO' and value in ('1', '0'):
+                value = 'ON' if value == '1' else 'OFF'
+        if header == 'RANG':
+            self.settings['RANG:AUTO'] = 'OFF'
+        if header in ('DCB', 'DCB:LEV'):
+            self._bias_from = self._bias()
+            self._bias_time = time.time()
+        self.settings[header] = value
+        self._restart()
+
+
+    def _cmd_STAR_IDN(self, query, args):
+        return 'HIOKI,IM3536,%s,V1.00' % self.serial
+
+    def _cmd_STAR_OPC(self, query, args):
+        return '1' if query else None
+
+    def _cmd_STAR_RST(self, query, args):
+        self.reset()
+
+    def _cmd_PRES(self, query, args):
+        self.reset()
+
+    def _cmd_STAR_CLS(self, query, args):
+        self.esr = 0
+        self.esr_regs = [0, 0, 0, 0]
+
+    def _cmd_STAR_ESR(self, query, args):
+        value, self.esr = self.esr, 0
+        return '%d' % value
+
+    def _cmd_STAR_SRE(self, query, args):
+        if query:
+            return '%d' % self.sre
+        self.sre = int(args[0])
+
+    def _cmd_STAR_STB(self, query, args):
+        stb = 0
+        for reg in range(4):
+            if self.esr_regs[reg] & self.ese_regs[reg]:
+                stb |= 0x01 << reg
+        return '%d' % stb
+
+    def _cmd_STAR_TST(self, query, args):
+        return '0'
+
+    def _cmd_STAR_TRG(self, query, args):
+        self._cycles_seen += 1
+        self.esr_regs[0] |= 0x01 << ESR0_BitMapping['EOM']
+        self._last = self._measure()
+
+    def _cmd_MEAS_ITEM(self, query, args):
+        if query:
+            return '%d,%d,%d' % tuple(self.settings['MEAS:ITEM'])
+        self.settings['MEAS:ITEM'] = [int(a) for a in args]
+
+    def _cmd_MEAS(self, query, args):
+        if self.settings['TRIG'] != 'INT' and hasattr(self, '_last'):
+            values = self._last
+        else:
+            if not self.realtime:
+                self._cycles_seen += 1
+            values = self._measure()
+        valid = self.settings['MEAS:VAL']
+        resp = []
+        if valid & 1:
+            resp.extend('%.6E' % v for v in values)
+        if valid & 2:
+            resp.append('%d' % self._judge(self.comparator, values[0]))
+        if valid & 4:
+            resp.append('%d' % self._bin(values[0]))
+        return ','.join(resp)
+
+    def _limits(self, mode, args):
+        args = [float(a) for a in args]
+        if mode == 'ABS':
+            return (mode, None, args[0], args[1])
+        return (mode, args[0], args[1], args[2])
+
+    def _judge(self, limits, value):
+        # -1 LO, 0 IN, 1 HI against (mode, reference, low, high)
+        if self.settings['COMP'] != 'ON' and limits is self.comparator:
+            return 0
+        (mode, ref, low, high) = limits
+        if mode == 'PER':
+            (low, high) = (ref * (1 + low / 100.0), ref * (1 + high / 100.0))
+        elif mode == 'DEV':
+            (low, high) = (ref + low, ref + high)
+        if value < low:
+            return -1
+        return 1 if value > high else 0
+
+    def _bin(self, value):
+        for num in sorted(self.bins):
+            if self._judge(self.bins[num], value) == 0:
+                return num
+        return 0
+
+    def _cmd_COMP_FLIM_ABS(self, query, args):
+        self.comparator = self._limits('ABS', args)
+
+    def _cmd_COMP_FLIM_PER(self, query, args):
+        self.comparator = self._limits('PER', args)
+
+    def _cmd_COMP_FLIM_DEV(self, query, args):
+        self.comparator = self._limits('DEV', args)
+
+    def _set_bin(self, mode, args):
+        num = int(args[0])
+        if args[1].upper() == 'OFF':
+            self.bins.pop(num, None)
+        else:
+            self.bins[num] = self._limits(mode, args[1:])
+
+    def _cmd_BIN_FLIM_ABS(self, query, args):
+        self._set_bin('ABS', args)
+
+    def _cmd_BIN_FLIM_PER(self, query, args):
+        self._set_bin('PER', args)
+
+    def _cmd_BIN_FLIM_DEV(self, query, args):
+        self._set_bin('DEV', args)
+
+    def _cmd_MONI(self, query, args):
+        z = abs(self.model.impedance(self.settings['FREQ'])) or 1e-30
+        if self.settings['LEV'] == 'CC':
+            iac = self.settings['LEV:CCUR']
+            vac = iac * z
+        else:
+            vac = self.settings['LEV:CVOL' if self.settings['LEV'] == 'CV'
+                                else 'LEV:VOLT']
+            iac = vac / z
+        vdc = self.settings['DCB:LEV'] if self.settings['DCB'] == 'ON' else 0.0
+        return '%.5E,%.5E,%.5E,%.5E' % (vac, iac, vdc, 0.0)
+
+    def _compensate(self, header, query, args):
+        # compensation data is taken instantly, CEM flags the end of it
+        if query:
+            return self.settings[header]
+        mode = args[0].upper()
+        if mode not in ('OFF', 'ALL', 'SPOT'):
+            raise ValueError(mode)
+        self.settings[header] = mode
+        if mode != 'OFF':
+            self.esr_regs[0] |= 0x01 << ESR0_BitMapping['CEM']
+
+    def _cmd_CORR_OPEN(self, query, args):
+        return self._compensate('CORR:OPEN', query, args)
+
+    def _cmd_CORR_SHOR(self, query, args):
+        return self._compensate('CORR:SHOR', query, args)
+
+    def _cmd_MEM(self, query, args):
+        if query:
+            return ','.join('%.6E' % v for values in self.memory
+                            for v in values)
+        self.memory_on = args[0].upper() in ('IN', 'ON')
+        self._memory_cycles = self._completed_cycles()
+
+    def _cmd_MEM_CLE(self, query, args):
+        self.memory = []
+
+    def _cmd_MEM_COUN(self, query, args):
+        return '%d' % len(self.memory)
+
+    def _cmd_PAN_SAVE(self, query, args):
+        num = int(args[0])
+        name = args[1].strip('"') if len(args) > 1 else ''
+        if 1 <= num <= PanelCount:
+            self.panels[num] = (name, copy.deepcopy(self.settings))
+
+    def _cmd_PAN_LOAD(self, query, args):
+        num = int(args[0])
+        if num in self.panels:
+            self.settings = copy.deepcopy(self.panels[num][1])
+            self._restart()
+        else:
+            self.esr |= 0x10 # execution error
+
+    def _cmd_PAN_CLE(self, query, args):
+        self.panels.pop(int(args[0]), None)
+
+    def _cmd_PAN_NAME(self, query, args):
+        num = int(args[0])
+        return '"%s"' % (self.panels[num][0] if num in self.panels else '')
+
+
+class _TCPHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        sim = self.server.simulator
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        rx = b''
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            rx += data
+            while True:
+                index = min([i for i in (rx.find(b'\r'), rx.find(b'\n'))
+                             if i >= 0] or [-1])
+                if index < 0:
+                    break
+                line, rx = rx[:index], rx[index + 1:]
+                if not line.strip():
+                    continue
+                resp = sim.handle(line.decode('utf-8', 'replace'))
+                if resp is not None:
+                    self.request.sendall(resp.encode('utf-8') + b'\r')
+
+
+class SimulatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, simulator, host = 'localhost', port = 3500):
+        self.simulator = simulator
+        socketserver.ThreadingTCPServer.__init__(self, (host, port),
+                                                 _TCPHandler)
+
+
+def serve_tcp(simulator, host = 'localhost', port = 3500):
+    # start a TCP server in a background thread. port 0 picks a free port,
+    # read it back from server.server_address. stop with server.shutdown()
+    server = SimulatorServer(simulator, host, port)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def serve_pty(simulator):
+    # attach the simulator to a new pseudo terminal, returns the slave
+    # device path to use as an ASRL resource
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+
+    def run():
+        rx = b''
+        while True:
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                return
+            rx += data
+            while b'\r' in rx:
+                line, rx = rx.split(b'\r', 1)
+                line = line.strip(b'\n')
+                if not line:
+                    continue
+                resp = simulator.handle(line.decode('utf-8', 'replace'))
+                if resp is not None:
+                    os.write(master, resp.encode('utf-8') + b'\r')
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return path
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='simulated HIOKI IM3536')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3500)
+    parser.add_argument('--pty', action='store_true',
+                        help='serve on a pseudo terminal instead of TCP')
+    parser.add_argument('--model', choices=sorted(ModelMapping),
+                        default='series')
+    parser.add_argument('--r', type=float, default=None)
+    parser.add_argument('--l', type=float, default=None)
+    parser.add_argument('--c', type=float, default=None)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every message')
+    parser.add_argument('--noise', type=float, default=0.0,
+                        help='relative noise on |Z| at MED')
+    parser.add_argument('--bias-tau', type=float, default=0.0,
+                        help='DC bias settling time constant, seconds')
+    args = parser.parse_args(argv)
+
+    kwargs = dict((k, getattr(args, k)) for k in ('r', 'l', 'c')
+                  if getattr(args, k) is not None)
+    if args.model == 'mlcc':
+        kwargs.pop('l', None)
+        if 'r' in kwargs:
+            kwargs['esr'] = kwargs.pop('r')
+    model = ModelMapping[args.model](**kwargs)
+    sim = SimulatedIM3536(model, latency=args.latency, noise=args.noise,
+                          bias_tau=args.bias_tau)
+
+    if args.pty:
+        print('serving on %s' % serve_pty(sim))
+    else:
+        server = serve_tcp(sim, args.host, args.port)
+        print('serving on %s:%d' % server.server_address)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# batched, columnar on-disk logging of MeasurementBuffers / ring buffer
+# batches. readings are collected into batch_size blocks and each block is
+# appended to the file as one chunk, so a run can be logged while it is
+# still going and long logs never sit in memory as python objects.
+#
+#   with open_sink('burnin.arrow', metadata=session_metadata(lcr)) as sink:
+#       for batch in stream.batches():
+#           sink.write(batch)
+#
+#   data, metadata = read_log('burnin.arrow')
+#
+# formats, picked from the file extension (see SinkMapping):
+#   .f64            raw float64 records + .json sidecar. numpy only,
+#                   readable while being written, np.memmap'd by read_log
+#   .csv            text, metadata as leading '#' lines
+#   .arrow          compressed Arrow IPC stream (pyarrow), readable while
+#                   being written
+#   .parquet        compressed Parquet row groups (pyarrow), only readable
+#                   once closed
+#   .h5 / .hdf5     compressed chunked HDF5 dataset (h5py), SWMR readable
+#                   while being written
+#
+# mode 'w' replaces an existing file, 'x' refuses to and 'a' appends to it
+# (.f64, .csv and hdf5 only, the columns have to match)
+import json
+import os
+import time
+
+import numpy as np
+
+from .buffer import MeasurementBuffer
+
+
+def session_metadata(lcr, **extra):
+    # settings worth keeping with a log: the driver's known profile
+    # (frequency, level, bias, speed, ...) plus instrument serial and
+    # start time. extra keys are added as given.
+    metadata = lcr._get_profile().to_dict()
+    metadata['serial_number'] = lcr._identity_instrument_serial_number
+    metadata['start_time'] = time.time()
+    metadata.update(extra)
+    return metadata
+
+
+def _as_records(data):
+    # MeasurementBuffer / structured array -> structured float64 array
+    if isinstance(data, MeasurementBuffer):
+        return data.data
+    return np.asarray(data)
+
+
+class Sink(object):
+    "Base class of the batched log writers"
+
+    # supports mode 'a'
+    appendable = False
+
+    def __init__(self, path, fields = None, metadata = None,
+                 batch_size = 4096, mode = 'w'):
+        # fields - column names, taken from the first write when None
+        # metadata - json serialisable dict stored with the data, when
+        #            appending the metadata already in the file is kept
+        # mode - 'w' overwrite, 'x' fail if path exists, 'a' append
+        if mode not in ('w', 'x', 'a'):
+            raise ValueError('unknown mode %s' % mode)
+        if mode == 'a' and not self.appendable:
+            raise ValueError('%s can\'t append' % type(self).__name__)
+        if mode == 'x' and os.path.exists(path):
+            raise FileExistsError(path)
+        self.path = path
+        self.fields = list(fields) if fields is not None else None
+        self.metadata = dict(metadata or {})
+        self.batch_size = int(batch_size)
+        self.mode = mode
+        self.written = 0
+        self._batch = None
+        self._opened = False
+        self.closed = False
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def write(self, data):
+        # data - MeasurementBuffer, structured array or sequence of them
+        records = _as_records(data)
+        if self.fields is None:
+            self.fields = list(records.dtype.names)
+        if self._batch is None:
+            self._batch = MeasurementBuffer(self.fields, self.batch_size)
+
+        if list(records.dtype.names) != self.fields:
+            raise ValueError('columns %s dont match log columns %s'
+                             % (records.dtype.names, self.fields))
+
+        self._batch.extend(records.view(np.float64))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+
+    def flush(self):
+        if not self._batch:
+            return
+        if not self._opened:
+            self._open()
+            self._opened = True
+        self._write_batch(self._batch.data)
+        self.written += len(self._batch)
+        self._batch.clear()
+
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        if self._opened:
+            self._close()
+        self.closed = True
+
+
+    def _dtype(self):
+        return np.dtype([(field, np.float64) for field in self.fields])
+
+
+    def _appending(self):
+        # True when _open should add to an existing log at path
+        return self.mode == 'a' and os.path.exists(self.path) \
+            and os.path.getsize(self.path) > 0
+
+
+    def _check_fields(self, fields):
+        if list(fields) != self.fields:
+            raise ValueError('columns %s dont match log columns %s'
+                             % (self.fields, list(fields)))
+
+
+    def _open(self):
+        raise NotImplementedError()
+
+
+    def _write_batch(self, records):
+        raise NotImplementedError()
+
+
+    def _close(self):
+        pass
+
+
+class RawSink(Sink):
+    "float64 records appended to a flat file, fields/metadata in path.json"
+
+    appendable = True
+
+    def _open(self):
+        if self._appending():
+            with open(self.path + '.json') as f:
+                self._check_fields(json.load(f)['fields'])
+            self._file = open(self.path, 'ab')
+            # drop a partly written trailing record
+            self._file.truncate(self._file.tell()
+                                - self._file.tell() % self._dtype().itemsize)
+            return
+        with open(self.path + '.json', 'w') as f:
+            json.dump({'fields': self.fields, 'metadata': self.metadata}, f)
+        self._file = open(self.path, 'wb')
+
+
+    def _write_batch(self, records):
+        records.tofile(self._file)
+        self._file.flush()
+
+
+    def _close(self):
+        self._file.close()
+
+
+class CSVSink(Sink):
+    "comma separated text, one header row, metadata as '#' comment lines"
+
+    appendable = True
+
+    def __init__(self, path, fields = None, metadata = None,
+                 batch_size = 4096, comments = True, mode = 'w'):
+        # comments - False for a plain header + rows file without metadata
+        super(CSVSink, self).__init__(path, fields, metadata, batch_size,
+                                      mode)
+        self.comments = comments
+
+
+    def _open(self):
+        if self._appending():
+            with open(self.path) as f:
+                for line in f:
+                    if not line.startswith('#'):
+                        break
+            self._check_fields(line.strip().split(','))
+            self._file = open(self.path, 'a')
+            return
+        self._file = open(self.path, 'w')
+        if self.comments:
+            for (key, value) in sorted(self.metadata.items()):
+                self._file.write('# %s: %s\n' % (key, json.dumps(value)))
+        self._file.write(','.join(self.fields) + '\n')
+
+
+    def _write_batch(self, records):
+        np.savetxt(self._file, records.view(np.float64).reshape(
+                len(records), len(self.fields)), delimiter=',', fmt='%.9g')
+        self._file.flush()
+
+
+    def _close(self):
+        self._file.close()
+
+
+def _arrow_schema(fields, metadata):
+    import pyarrow as pa
+    return pa.schema([(field, pa.float64()) for field in fields],
+                     metadata={'hioki': json.dumps(metadata)})
+
+
+def _arrow_batch(records, schema):
+    import pyarrow as pa
+    return pa.RecordBatch.from_arrays(
+            [np.ascontiguousarray(records[field]) for field in schema.names],
+            schema=schema)
+
+
+class ArrowSink(Sink):
+    "compressed Arrow IPC stream, one record batch per flush"
+
+    def __init__(self, path, fields = None, metadata = None,
+                 batch_size = 4096, compression = 'zstd', mode = 'w'):
+        # compression - 'zstd', 'lz4' or None for plain buffers that
+        #               read_log can memory map without copying
+        super(ArrowSink, self).__init__(path, fields, metadata, batch_size,
+                                        mode)
+        self.compression = compression
+
+
+    def _open(self):
+        import pyarrow as pa
+        self._schema = _arrow_schema(self.fields, self.metadata)
+        self._file = pa.OSFile(self.path, 'wb')
+        self._writer = pa.ipc.new_stream(
+                self._file, self._schema,
+                options=pa.ipc.IpcWriteOptions(compression=self.compression))
+
+
+    def _write_batch(self, records):
+        self._writer.write_batch(_arrow_batch(records, self._schema))
+        self._file.flush()
+
+
+    def _close(self):
+        self._writer.close()
+        self._file.close()
+
+
+class ParquetSink(Sink):
+    "compressed Parquet, one row group per flush"
+
+    def __init__(self, path, fields = None, metadata = None,
+                 batch_size = 65536, compression = 'zstd', mode = 'w'):
+        super(ParquetSink, self).__init__(path, fields, metadata, batch_size,
+                                          mode)
+        self.compression = compression
+
+
+    def _open(self):
+        import pyarrow.parquet as pq
+        self._schema = _arrow_schema(self.fields, self.metadata)
+        self._writer = pq.ParquetWriter(self.path, self._schema,
+                                        compression=self.compression)
+
+
+    def _write_batch(self, records):
+        import pyarrow as pa
+        self._writer.write_table(pa.Table.from_batches(
+                [_arrow_batch(records, self._schema)]))
+
+
+    def _close(self):
+        self._writer.close()
+
+
+class HDF5Sink(Sink):
+    "chunked, compressed HDF5 dataset 'readings', metadata in its attrs"
+
+    appendable = True
+
+    def __init__(self, path, fields = None, metadata = None,
+                 batch_size = 4096, compression = 'gzip', mode = 'w'):
+        super(HDF5Sink, self).__init__(path, fields, metadata, batch_size,
+                                       mode)
+        self.compression = compression
+
+
+    def _open(self):
+        import h5py
+        if self._appending():
+            self._file = h5py.File(self.path, 'a', libver='latest')
+            self._dataset = self._file['readings']
+            self._check_fields(self._dataset.dtype.names)
+            self._file.swmr_mode = True
+            return
+        self._file = h5py.File(self.path, 'w', libver='latest')
+        self._dataset = self._file.create_dataset(
+                'readings', shape=(0,), maxshape=(None,), dtype=self._dtype(),
+                chunks=(self.batch_size,), compression=self.compression)
+        for (key, value) in self.metadata.items():
+            self._dataset.attrs[key] = json.dumps(value)
+        # readers may open the file with swmr=True while we append
+        self._file.swmr_mode = True
+
+
+    def _write_batch(self, records):
+        start = self._dataset.shape[0]
+        self._dataset.resize((start + len(records),))
+        self._dataset[start:] = records
+        self._dataset.flush()
+
+
+    def _close(self):
+        self._file.close()
+
+
+SinkMapping = {
+        '.f64': RawSink,
+        '.csv': CSVSink,
+        '.arrow': ArrowSink,
+        '.parquet': ParquetSink,
+        '.h5': HDF5Sink,
+        '.hdf5': HDF5Sink,
+        }
+
+
+def _sink_class(path, format):
+    ext = format or os.path.splitext(path)[1]
+    if not ext.startswith('.'):
+        ext = '.' + ext
+    if ext.lower() not in SinkMapping:
+        raise ValueError('unknown log format %s' % ext)
+    return SinkMapping[ext.lower()]
+
+
+def open_sink(path, fields = None, metadata = None, format = None, **kwargs):
+    # format - SinkMapping key, defaults to the extension of path
+    return _sink_class(path, format)(path, fields, metadata, **kwargs)
+
+
+def read_log(path, format = None):
+    # returns (data, metadata). data is a memory mapped structured array
+    # for .f64, a pyarrow Table (memory mapped for .arrow) for arrow and
+    # parquet, and a structured array read into memory for hdf5 and csv.
+    # logs still being written can be read, a partly written trailing
+    # record is left out.
+    cls = _sink_class(path, format)
+
+    if cls is RawSink:
+        with open(path + '.json') as f:
+            header = json.load(f)
+        dtype = np.dtype([(field, np.float64) for field in header['fields']])
+        count = os.path.getsize(path) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype), header['metadata']
+        return (np.memmap(path, dtype=dtype, mode='r', shape=(count,)),
+                header['metadata'])
+
+    if cls is CSVSink:
+        metadata = {}
+        with open(path) as f:
+            for line in f:
+                if not line.startswith('#'):
+                    break
+                (key, value) = line[1:].split(':', 1)
+                metadata[key.strip()] = json.loads(value)
+        data = np.genfromtxt(path, delimiter=',', names=True,
+                             skip_header=len(metadata), ndmin=1)
+        return data, metadata
+
+    if cls is ArrowSink:
+        import pyarrow as pa
+        table = pa.ipc.open_stream(pa.memory_map(path)).read_all()
+        return table, _arrow_metadata(table.schema)
+
+    if cls is ParquetSink:
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, memory_map=True)
+        return table, _arrow_metadata(table.schema)
+
+    import h5py
+    # copied out so the file isn't left open, an open reader would stop a
+    # later sink from appending to it
+    with h5py.File(path, 'r', libver='latest', swmr=True) as f:
+        dataset = f['readings']
+        metadata = dict((key, json.loads(value))
+                        for (key, value) in dataset.attrs.items())
+        return dataset[...], metadata
+
+
+def _arrow_metadata(schema):
+    metadata = schema.metadata or {}
+    return json.loads(metadata.get(b'hioki', b'{}'))
@@ -0,0 +1,82 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# on-disk cache of instrument settings between driver sessions, keyed by
+# the *IDN? manufacturer, model, serial and firmware. see
+# hiokiIM3536._load_state_cache
+#
+#   lcr = hiokiIM3536(resource, state_cache='~/.cache/im3536.json')
+import json
+import os
+import tempfile
+import time
+
+
+class StateCache(object):
+    "JSON file of instrument key : saved state"
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+
+    def _write(self, entries):
+        # write to a temp file and rename so readers never see a partial file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except:
+            os.unlink(tmp)
+            raise
+
+
+    def load(self, key):
+        return self._read().get(key)
+
+
+    def save(self, key, state):
+        entries = self._read()
+        state = dict(state)
+        state['saved'] = time.time()
+        entries[key] = state
+        self._write(entries)
+
+
+    def invalidate(self, key):
+        entries = self._read()
+        if entries.pop(key, None) is not None:
+            self._write(entries)
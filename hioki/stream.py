@@ -0,0 +1,180 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2015 Marshall Scholz
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+# continuous acquisition on a background thread into a RingBuffer, so a
+# slow consumer can't stall the meter. see hiokiIM3536._start_streaming
+#
+#   stream = lcr._start_streaming(capacity=100000)
+#   for batch in stream.batches():
+#       process(batch['TIMESTAMP'], batch['IMPEDANCE'])
+#   stream.stop()
+import threading
+import time
+
+import ivi
+
+from .buffer import RingBuffer
+
+
+class MeasurementStream(object):
+    "Background producer filling a RingBuffer with timestamped readings"
+
+    def __init__(self, lcr, capacity = 65536, status = None,
+                 max_errors = 10, backoff = 0.05):
+        # status - add a STATUS column with the ESR0 value of each reading,
+        #          on unless False. the stream always waits for EOM so it
+        #          never repeats a reading, see start
+        # max_errors - consecutive failed readings before the stream gives
+        #              up, the error is then raised from read/batches
+        # backoff - seconds to wait after the first failed reading, doubled
+        #           for each further consecutive failure
+        self.lcr = lcr
+        order = lcr._measurement_item_order_cache
+        if order is None:
+            order = lcr._get_measurement_item_order()
+        self.order = list(order)
+        self.status = status is not False
+        self.max_errors = int(max_errors)
+        self.backoff = backoff
+
+        # readings go through the driver's own columnar fetch and derivation
+        # (software compensation, derived parameters), so the ring holds the
+        # same columns _get_measurements_array would return
+        self._scratch = lcr._new_measurement_buffer(['TIMESTAMP'], 1,
+                                                    self.status)
+        self.ring = RingBuffer(lcr._derive_buffer(self._scratch).fields,
+                               capacity)
+
+        self.errors = 0
+        self.last_error = None
+        self.error = None
+        self._wait_mode = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+
+    @property
+    def overruns(self):
+        return self.ring.overruns
+
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+
+    def start(self):
+        # NONE/OPC would hand back the same reading again whenever the
+        # loop is faster than the meter, so wait on ESR0 while streaming
+        lcr = self.lcr
+        self._wait_mode = lcr._measurement_wait_mode
+        if self._wait_mode not in ('POLL', 'SRQ'):
+            lcr._set_measurement_wait_mode('POLL')
+        lcr._clear_end_of_measurement()
+        self._thread.start()
+        return self
+
+
+    def stop(self, timeout = None):
+        self._stop.set()
+        self._thread.join(timeout)
+        self.ring.wake()
+
+
+    def _run(self):
+        lcr = self.lcr
+        scratch = self._scratch
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    scratch.clear()
+                    lcr._fetch_measurements_into(scratch, (0.0,))
+                    scratch.rows[0, 0] = time.time()
+                    row = lcr._derive_buffer(scratch).rows[0]
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+                    failures += 1
+                    if failures >= self.max_errors:
+                        self.error = e
+                        return
+                    self._stop.wait(self.backoff * 2 ** (failures - 1))
+                    continue
+                failures = 0
+                self.ring.append(row)
+        finally:
+            lcr._set_measurement_wait_mode(self._wait_mode)
+            self.ring.wake()
+
+
+    def _check_error(self):
+        if self.error is not None and not len(self.ring):
+            raise ivi.IOException('stream stopped after %d consecutive '
+                                  'errors' % self.max_errors) from self.error
+
+
+    def read(self, max_count = None, timeout = None):
+        self._check_error()
+        return self.ring.read(max_count, timeout)
+
+
+    def batches(self, max_count = None, timeout = 0.1):
+        # generator of structured arrays of new readings until stopped and
+        # drained
+        while True:
+            batch = self.ring.read(max_count, timeout)
+            if len(batch):
+                yield batch
+            elif not self.running:
+                self._check_error()
+                return
+
+
+    def record(self, sink, count = None, duration = None):
+        # write batches to a sinks.Sink until count readings or duration
+        # seconds have been written, or the stream stops. the sink is
+        # flushed, not closed. returns the number of readings written.
+        written = 0
+        end = None if duration is None else time.time() + duration
+        for batch in self.batches():
+            if count is not None:
+                batch = batch[:count - written]
+            sink.write(batch)
+            written += len(batch)
+            if count is not None and written >= count:
+                break
+            if end is not None and time.time() >= end:
+                break
+        sink.flush()
+        return written
+
+
+    def __iter__(self):
+        # one reading (numpy record) at a time
+        for batch in self.batches():
+            for reading in batch:
+                yield reading